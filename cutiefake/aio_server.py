@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import asyncio
+import signal
+import grpc
+import cutiefake.proto.elily_pb2_grpc
+from concurrent import futures
+
+
+class ELilyAioGateway(cutiefake.proto.elily_pb2_grpc.ELilyServiceServicer):
+    def __init__(self, gateway, executor):
+        """ EgoisticLily gRPCサーバークラス (asyncio版)
+
+        通信はイベントループで処理し、変換処理 (CPUバウンド) は専用のスレッドプールで実行する
+
+        :param gateway: ELilyGateway (変換処理を共有)
+        :param executor: 変換処理用のスレッドプール
+        """
+        self.gateway = gateway
+        self.executor = executor
+
+    async def run(self, func, *args):
+        """ 変換処理をスレッドプールで実行
+
+        :param func:
+        :param args:
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def Convert(self, request, context):
+        """ 変換
+
+        :param request:
+        :param context:
+        :return:
+        """
+        return await self.run(self.gateway.Convert, request, None)
+
+    async def PartialConvert(self, request, context):
+        """ N-best変換
+
+        :param request:
+        :param context:
+        :return:
+        """
+        return await self.run(self.gateway.PartialConvert, request, None)
+
+    async def BatchConvert(self, request, context):
+        """ 一括変換
+
+        :param request:
+        :param context:
+        :return:
+        """
+        return await self.run(self.gateway.BatchConvert, request, None)
+
+    async def GetStats(self, request, context):
+        """ 稼働状況取得 (集計のみのためイベントループで実行)
+
+        :param request:
+        :param context:
+        :return:
+        """
+        return self.gateway.GetStats(request, None)
+
+    async def ConvertStream(self, request_iterator, context):
+        """ 逐次変換
+
+        受信はタスクで行い、最新のイベントのみ保持する。
+        変換中に新しいイベントが届いた場合は、その変換を中断して最新の入力を処理する
+
+        :param request_iterator:
+        :param context:
+        :return:
+        """
+        slot = {"event": None, "reset": False, "closed": False}
+        updated = asyncio.Event()
+
+        async def receive():
+            try:
+                async for event in request_iterator:
+                    # 破棄されるイベントのリセット要求は引き継ぐ
+                    slot["reset"] = slot["reset"] or event.reset
+                    slot["event"] = event
+                    updated.set()
+            finally:
+                slot["closed"] = True
+                updated.set()
+
+        def has_new():
+            return slot["event"] is not None
+
+        receiver = asyncio.ensure_future(receive())
+        session = self.gateway.converter.session()
+        try:
+            while True:
+                await updated.wait()
+                updated.clear()
+                event, reset = slot["event"], slot["reset"]
+                slot["event"] = None
+                slot["reset"] = False
+                if event is None:
+                    if slot["closed"]:
+                        break
+                    continue
+
+                response = await self.run(self.gateway.convert_event, session, event, reset, has_new)
+                if response is not None:
+                    yield response
+        finally:
+            receiver.cancel()
+
+
+async def run_server(gateway, port, max_workers, grace, options=None):
+    """ サーバー実行 (SIGINT/SIGTERMで処理中のリクエストを待って停止)
+
+    :param gateway: ELilyGateway
+    :param port: ポート番号
+    :param max_workers: 変換処理のスレッド数
+    :param grace: 停止時に処理中のリクエストを待つ時間 [sec]
+    :param options: gRPCサーバーオプション
+    :return:
+    """
+    executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+    gateway.metrics.executor = executor
+    server = grpc.aio.server(options=options)
+    cutiefake.proto.elily_pb2_grpc.add_ELilyServiceServicer_to_server(
+        ELilyAioGateway(gateway, executor), server)
+
+    # portの設定
+    port_str = '[::]:' + port
+    server.add_insecure_port(port_str)
+    await server.start()
+    print("EgoisticLily Server (asyncio) Start!  Port %d" % int(port))
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    await stop_event.wait()
+
+    # 新規リクエストの受付を停止し、処理中のリクエストを待ってから終了
+    await server.stop(grace)
+    executor.shutdown(wait=True)
+
+
+def serve(gateway, port, max_workers, grace, options=None):
+    """ asyncioサーバー起動
+
+    :param gateway: ELilyGateway
+    :param port: ポート番号
+    :param max_workers: 変換処理のスレッド数
+    :param grace: 停止時に処理中のリクエストを待つ時間 [sec]
+    :param options: gRPCサーバーオプション
+    :return:
+    """
+    asyncio.run(run_server(gateway, port, max_workers, grace, options))
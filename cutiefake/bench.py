@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent import futures
+import numpy as np
+import torch
+import grpc
+import cutiefake.proto.elily_pb2
+import cutiefake.proto.elily_pb2_grpc
+from cutiefake.converter import Converter, DEFAULT_BEAM_WIDTH, DEFAULT_MAX_CANDIDATES
+from cutiefake.scorer import DEVICE_CHOICES
+from cutiefake.trace import Tracer
+
+DEFAULT_TEXTS = [
+    "きょうはよいてんきです",
+    "わたしのなまえ",
+    "きょうはいいてんきですね",
+]
+DEFAULT_WORKLOAD_SIZE = 200
+DEFAULT_SEED = 0
+
+
+def surface_readings(converter):
+    """ 表記から読みへの対応表作成
+
+    同じ表記に複数の読みがある場合は最初に見つかった読みとする
+
+    :param converter: 変換モジュール
+    :return: {表記: 読み}
+    """
+    readings = {}
+    for reading, key_id in converter.trie.items():
+        for word_id in converter.cand_ids[converter.cand_offsets[key_id]:converter.cand_offsets[key_id + 1]]:
+            readings.setdefault(converter.surface(int(word_id)), reading)
+    return readings
+
+
+def build_workload(converter, link_file=None, size=DEFAULT_WORKLOAD_SIZE, seed=DEFAULT_SEED):
+    """ 再現可能な入力テキスト (かな) の生成
+
+    word_link.csv の文節と係り先を words.csv の読みでかなへ戻して使用し、
+    不足分は辞書の読みをランダムに連結して補う
+
+    :param converter: 変換モジュール
+    :param link_file: word_link.csv (Noneの場合は辞書の読みのみ使用)
+    :param size: テキスト数
+    :param seed: 乱数シード
+    :return: 入力テキストのリスト
+    """
+    rand = random.Random(seed)
+    readings = surface_readings(converter)
+
+    texts = []
+    if link_file is not None:
+        seen = set()
+        with open(link_file, "r", encoding="utf-8") as f:
+            for row in csv.reader(f, delimiter=","):
+                # 文節と係り先を連結して1入力とする (辞書に無い単語を含む行は除外)
+                surfaces = " ".join(row).split()
+                if len(surfaces) == 0 or not all(surface in readings for surface in surfaces):
+                    continue
+                text = "".join([readings[surface] for surface in surfaces])
+                if text not in seen:
+                    seen.add(text)
+                    texts.append(text)
+        rand.shuffle(texts)
+        texts = texts[:size]
+
+    vocab = sorted(set(readings.values()))
+    while len(texts) < size and len(vocab) > 0:
+        texts.append("".join([rand.choice(vocab) for _ in range(rand.randint(2, 6))]))
+    return texts
+
+
+def peak_rss_mb():
+    """ プロセスの最大常駐メモリ [MB]
+
+    :return:
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS は byte 単位
+    return rss / (1024. * 1024.) if sys.platform == "darwin" else rss / 1024.
+
+
+def summarize(latency, wall):
+    """ レイテンシ集計
+
+    peak_rss_mb はプロセス全体の最大値のため、プロセス内でサーバーを起動した場合はクライアント分も含む
+
+    :param latency: リクエストごとのレイテンシ [ms]
+    :param wall: 計測全体の経過時間 [sec]
+    :return: 集計結果 (成功したリクエストがない場合、レイテンシはNone)
+    """
+    if len(latency) == 0:
+        return {"requests": 0,
+                "mean_ms": None,
+                "p50_ms": None,
+                "p95_ms": None,
+                "p99_ms": None,
+                "max_ms": None,
+                "throughput_rps": 0.,
+                "peak_rss_mb": peak_rss_mb()}
+
+    return {"requests": len(latency),
+            "mean_ms": float(latency.mean()),
+            "p50_ms": float(np.percentile(latency, 50)),
+            "p95_ms": float(np.percentile(latency, 95)),
+            "p99_ms": float(np.percentile(latency, 99)),
+            "max_ms": float(latency.max()),
+            "throughput_rps": len(latency) / wall,
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def bench_converter(converter, texts, repeat):
+    """ Converter単体の計測 (Converter.__call__)
+
+    :param converter: 変換モジュール
+    :param texts: 入力テキストのリスト
+    :param repeat: 計測回数 (テキストごと)
+    :return: 集計結果
+    """
+    for text in texts[:10]:
+        converter(text)
+
+    latency = []
+    wall_start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            start = time.perf_counter()
+            converter(text)
+            latency.append((time.perf_counter() - start) * 1000.)
+    return summarize(np.array(latency), time.perf_counter() - wall_start)
+
+
+def bench_server(target, texts, repeat, concurrency, n_best):
+    """ gRPCサーバーの同時接続時の計測 (PartialConvert)
+
+    :param target: 接続先 (host:port)
+    :param texts: 入力テキストのリスト
+    :param repeat: 計測回数 (テキストごと)
+    :param concurrency: 同時接続数
+    :param n_best: 取得する変換候補数
+    :return: 集計結果
+    """
+    requests = [text for _ in range(repeat) for text in texts]
+    latency = []
+    errors = []
+    lock = threading.Lock()
+
+    def client(index):
+        with grpc.insecure_channel(target) as channel:
+            stub = cutiefake.proto.elily_pb2_grpc.ELilyServiceStub(channel)
+            try:
+                stub.PartialConvert(cutiefake.proto.elily_pb2.PartialConvertReq(in_str=texts[0], n_best=n_best))
+            except grpc.RpcError:
+                # 接続できない場合も計測は行い、エラー数として集計する
+                pass
+            barrier.wait()
+            local = []
+            # 各クライアントはリクエストを同時接続数おきに担当する
+            for text in requests[index::concurrency]:
+                start = time.perf_counter()
+                try:
+                    stub.PartialConvert(cutiefake.proto.elily_pb2.PartialConvertReq(in_str=text, n_best=n_best))
+                except grpc.RpcError as e:
+                    errors.append(str(e.code()))
+                    continue
+                local.append((time.perf_counter() - start) * 1000.)
+            with lock:
+                latency.extend(local)
+
+    barrier = threading.Barrier(concurrency + 1)
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    ret = summarize(np.array(latency), time.perf_counter() - wall_start)
+    ret["concurrency"] = concurrency
+    ret["errors"] = len(errors)
+    return ret
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="cutiefake bench")
+    arg_parser.add_argument('-m', '--model_path', help='model path', required=True)
+    arg_parser.add_argument('-t', '--text', help='pre text', action='append')
+    arg_parser.add_argument('-l', '--link_file', help='word_link.csv for workload', default=None)
+    arg_parser.add_argument('-w', '--workload', help='workload text file (one input per line)', default=None)
+    arg_parser.add_argument('--size', help='workload size', type=int, default=DEFAULT_WORKLOAD_SIZE)
+    arg_parser.add_argument('--seed', help='workload random seed', type=int, default=DEFAULT_SEED)
+    arg_parser.add_argument('-r', '--repeat', help='repeat num', type=int, default=1)
+    arg_parser.add_argument('-c', '--concurrency', help='concurrent client num (0: skip server)', type=int,
+                            action='append')
+    arg_parser.add_argument('-n', '--n_best', help='n best for server requests', type=int, default=1)
+    arg_parser.add_argument('--target', help='benchmark running server (host:port) instead of in-process',
+                            default=None)
+    arg_parser.add_argument('--max_workers', help='in-process server worker thread num', type=int, default=10)
+    arg_parser.add_argument('-b', '--beam_width', help='beam width', type=int, default=DEFAULT_BEAM_WIDTH)
+    arg_parser.add_argument('-d', '--device', help='device', choices=DEVICE_CHOICES, default='cpu')
+    arg_parser.add_argument('--threads', help='intra-op thread num (CPU)', type=int, default=None)
+    arg_parser.add_argument('-k', '--max_candidates', help='max candidates per reading', type=int,
+                            default=DEFAULT_MAX_CANDIDATES)
+    arg_parser.add_argument('-q', '--quantize', help='int8 dynamic quantization (CPU)', action='store_true')
+    arg_parser.add_argument('--trace', help='report per-phase timing of Converter', action='store_true')
+    arg_parser.add_argument('-o', '--output', help='output json file (default: stdout)', default=None)
+    args = arg_parser.parse_args(argv)
+
+    load_start = time.perf_counter()
+    converter = Converter(args.model_path, args.beam_width, args.device, args.threads, args.max_candidates,
+                          args.quantize, Tracer() if args.trace else None)
+    load_time = time.perf_counter() - load_start
+
+    if args.text is not None:
+        texts = args.text
+    elif args.workload is not None:
+        with open(args.workload, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if len(line.strip()) > 0]
+    else:
+        texts = build_workload(converter, args.link_file, args.size, args.seed)
+
+    report = {"env": {"python": platform.python_version(),
+                      "torch": torch.__version__,
+                      "platform": platform.platform(),
+                      "cpu_count": os.cpu_count(),
+                      "torch_threads": torch.get_num_threads(),
+                      "device": converter.device,
+                      "model_version": converter.version,
+                      "beam_width": args.beam_width,
+                      "max_candidates": args.max_candidates,
+                      "quantize": args.quantize},
+              "workload": {"texts": len(texts),
+                           "chars_mean": float(np.mean([len(text) for text in texts])),
+                           "link_file": args.link_file,
+                           "seed": args.seed},
+              "load_sec": load_time}
+    report["converter"] = bench_converter(converter, texts, args.repeat)
+    if converter.tracer is not None:
+        report["converter"]["phases"] = converter.tracer.stats()["mean"]
+
+    concurrency_list = args.concurrency if args.concurrency is not None else [1, 4, 16]
+    concurrency_list = [concurrency for concurrency in concurrency_list if concurrency > 0]
+    if len(concurrency_list) > 0:
+        server = None
+        target = args.target
+        if target is None:
+            from cutiefake.server import ELilyGateway
+
+            # 変換結果キャッシュは計測結果を歪めるため無効にする
+            # モデルを二重に読み込まないよう、計測済みの変換モジュールをそのまま使う
+            gateway = ELilyGateway(args.model_path, args.beam_width, args.device, args.threads,
+                                   cache_entries=0, max_candidates=args.max_candidates, quantize=args.quantize,
+                                   converter=converter)
+            server = grpc.server(futures.ThreadPoolExecutor(max_workers=args.max_workers))
+            cutiefake.proto.elily_pb2_grpc.add_ELilyServiceServicer_to_server(gateway, server)
+            target = "127.0.0.1:%d" % server.add_insecure_port("127.0.0.1:0")
+            server.start()
+
+        report["server"] = {"target": args.target if args.target is not None else "in-process",
+                            "n_best": args.n_best,
+                            "runs": [bench_server(target, texts, args.repeat, concurrency, args.n_best)
+                                     for concurrency in concurrency_list]}
+        if server is not None:
+            server.stop(0)
+            gateway.scheduler.close()
+
+    out_str = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write(out_str + "\n")
+    print(out_str)
+
+
+if __name__ == "__main__":
+    main()
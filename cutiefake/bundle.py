@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import os
+import csv
+import json
+import hashlib
+import argparse
+import marisa_trie
+import numpy as np
+import torch
+from cutiefake.model import BertDecoder, ELilyModel, BERT_EMB_DIM
+from cutiefake.emb_table import decode_codes, load_table, load_costs, DECODED_EMB_FILE, STANDALONE_COST_FILE
+from cutiefake.emb_table import SurfaceTable
+from cutiefake.scorer import Scorer, score_table, quantize_model, export_scorer, load_scorer
+
+BUNDLE_FILE = "bundle.json"
+BUNDLE_FORMAT = 2
+TRIE_FILE = "reading.marisa"
+CAND_OFFSET_FILE = "cand_offsets.npy"
+CAND_ID_FILE = "cand_ids.npy"
+SCORER_FILE = "scorer.pt"
+SURFACE_FILE = "surfaces.npy"
+SURFACE_OFFSET_FILE = "surface_offsets.npy"
+CODE_FILE = "codes.npy"
+DECODER_FILE = "decoder.mdl"
+DNN_FILE = "dnn.mdl"
+
+
+def make_reading_index(readings, costs):
+    """ 読みごとの候補リスト作成
+
+    読みのTrieのキーIDごとに、単語IDを単体コストの低い順に並べる
+
+    :param readings: 単語IDごとの読み
+    :param costs: 単語IDごとの単体コスト
+    :return: (読みのTrie, キーIDごとの開始オフセット (R+1), 単語ID)
+    """
+    trie = marisa_trie.Trie(readings)
+    key_ids = np.array([trie[reading] for reading in readings], dtype=np.int64)
+    cand_ids = np.lexsort((np.asarray(costs), key_ids)).astype(np.uint32)
+    offsets = np.zeros(len(trie) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(key_ids, minlength=len(trie)))
+    return trie, offsets, cand_ids
+
+
+class Bundle:
+    def __init__(self, bundle_path):
+        """ コンパイル済みモデルバンドル
+
+        配列とTrieはメモリマップで読み込むため、起動時にパース処理は発生しない
+
+        :param bundle_path: バンドルパス (directory)
+        """
+        self.path = os.path.abspath(bundle_path)
+        with open(self.path + "/" + BUNDLE_FILE, "r") as f:
+            self.info = json.load(f)
+        if self.info["format"] != BUNDLE_FORMAT:
+            raise ValueError("unsupported bundle format: %s" % self.info["format"])
+
+        self.version = self.info["version"]
+        self.trie = marisa_trie.Trie().mmap(self.path + "/" + TRIE_FILE)
+        self.cand_offsets = np.load(self.path + "/" + CAND_OFFSET_FILE, mmap_mode="r")
+        self.cand_ids = np.load(self.path + "/" + CAND_ID_FILE, mmap_mode="r")
+        self.surfaces = SurfaceTable(np.load(self.path + "/" + SURFACE_FILE, mmap_mode="r"),
+                                     np.load(self.path + "/" + SURFACE_OFFSET_FILE, mmap_mode="r"))
+        self.codes = np.load(self.path + "/" + CODE_FILE, mmap_mode="r")
+        self.emb_table = np.load(self.path + "/" + DECODED_EMB_FILE, mmap_mode="r")
+        self.costs = np.load(self.path + "/" + STANDALONE_COST_FILE, mmap_mode="r")
+
+    def load_dnn(self, device, quantize=False):
+        """ ELilyModel読み込み
+
+        :param device: 使用デバイス
+        :param quantize: int8 動的量子化する場合はTrue (CPUのみ)
+        :return:
+        """
+        model = ELilyModel().to(device)
+        model.load_state_dict(self.load_state(DNN_FILE, device), assign=True)
+        if quantize:
+            return quantize_model(model)
+        return model.eval()
+
+    def has_scorer(self):
+        """ TorchScript出力済みのコスト算出グラフを含むか判定
+
+        :return:
+        """
+        return os.path.isfile(self.path + "/" + SCORER_FILE)
+
+    def load_scorer(self):
+        """ TorchScript出力済みのコスト算出エンジン読み込み (CPUのみ)
+
+        :return:
+        """
+        return load_scorer(self.path + "/" + SCORER_FILE)
+
+    def load_state(self, file_name, device):
+        """ 重み読み込み
+
+        CPUの場合はメモリマップで読み込み、複数プロセス間でページキャッシュを共有する
+
+        :param file_name: ファイル名
+        :param device: 使用デバイス
+        :return: state_dict
+        """
+        if device == "cpu":
+            return torch.load(self.path + "/" + file_name, map_location="cpu", mmap=True)
+        return torch.load(self.path + "/" + file_name, map_location=device)
+
+
+def is_bundle(model_path):
+    """ コンパイル済みバンドルか判定
+
+    :param model_path: モデルパス
+    :return:
+    """
+    return os.path.isfile(model_path + "/" + BUNDLE_FILE)
+
+
+def file_hash(hash_obj, file_path):
+    """ ファイル内容をハッシュへ追加
+
+    :param hash_obj: hashlibオブジェクト
+    :param file_path: ファイルパス
+    :return:
+    """
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hash_obj.update(chunk)
+
+
+def compile_bundle(model_path, out_path, device="cpu", script=True):
+    """ モデルディレクトリ (words.csv, decoder.mdl, dnn.mdl) からバンドルを生成
+
+    :param model_path: 入力モデルパス
+    :param out_path: 出力バンドルパス
+    :param device: デコード・コスト算出時の使用デバイス
+    :param script: TorchScriptのコスト算出グラフを出力する場合はTrue
+    :return: バンドル情報
+    """
+    model_path = os.path.abspath(model_path)
+    out_path = os.path.abspath(out_path)
+    if not os.path.isdir(out_path):
+        os.makedirs(out_path)
+
+    surfaces = []
+    readings = []
+    codes = []
+    with open(model_path + "/words.csv", "r") as f:
+        reader = csv.reader(f, delimiter=",", doublequote=True, quotechar='"')
+        for row in reader:
+            surfaces.append(row[0].encode("utf-8"))
+            readings.append(row[1])
+            codes.append(float(row[2]))
+    codes = np.array(codes, dtype=np.float32)
+
+    # 表記 (連結バイト列 + オフセット)
+    offsets = np.zeros(len(surfaces) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(surface) for surface in surfaces])
+    np.save(out_path + "/" + SURFACE_FILE, np.frombuffer(b"".join(surfaces), dtype=np.uint8))
+    np.save(out_path + "/" + SURFACE_OFFSET_FILE, offsets)
+    np.save(out_path + "/" + CODE_FILE, codes)
+
+    # 重み (CPUへ配置して保存)
+    decoder = BertDecoder()
+    decoder.load_state_dict(torch.load(model_path + "/" + DECODER_FILE, map_location="cpu"))
+    decoder.eval()
+    torch.save(decoder.state_dict(), out_path + "/" + DECODER_FILE)
+    dnn = ELilyModel()
+    dnn.load_state_dict(torch.load(model_path + "/" + DNN_FILE, map_location="cpu"))
+    dnn.eval()
+    torch.save(dnn.state_dict(), out_path + "/" + DNN_FILE)
+
+    # デコード済み埋め込み (事前生成済みの場合はそのまま使用)
+    table = load_table(model_path)
+    if table is None or len(table) != len(codes):
+        table = decode_codes(decoder.to(device), codes, device=device)
+    np.save(out_path + "/" + DECODED_EMB_FILE, np.asarray(table, dtype=np.float32))
+
+    # 単語単体のコスト (事前生成済みの場合はそのまま使用)
+    costs = load_costs(model_path)
+    if costs is None or len(costs) != len(codes):
+        costs = score_table(Scorer(dnn.to(device).eval(), device), table)
+    np.save(out_path + "/" + STANDALONE_COST_FILE, np.asarray(costs, dtype=np.float32))
+
+    # Trie (読み -> キーID) と、キーIDごとの候補リスト (単体コスト順)
+    trie, cand_offsets, cand_ids = make_reading_index(readings, costs)
+    trie.save(out_path + "/" + TRIE_FILE)
+    np.save(out_path + "/" + CAND_OFFSET_FILE, cand_offsets)
+    np.save(out_path + "/" + CAND_ID_FILE, cand_ids)
+
+    # CPU推論用のコスト算出グラフ (TorchScript)
+    if script:
+        export_scorer(dnn, out_path + "/" + SCORER_FILE)
+    elif os.path.isfile(out_path + "/" + SCORER_FILE):
+        os.remove(out_path + "/" + SCORER_FILE)
+
+    version = hashlib.sha1()
+    for file_name in [TRIE_FILE, CAND_ID_FILE, SURFACE_FILE, SURFACE_OFFSET_FILE, DECODED_EMB_FILE, DNN_FILE]:
+        file_hash(version, out_path + "/" + file_name)
+
+    info = {"format": BUNDLE_FORMAT,
+            "version": version.hexdigest(),
+            "words": len(codes),
+            "emb_dim": BERT_EMB_DIM}
+    with open(out_path + "/" + BUNDLE_FILE, "w") as f:
+        json.dump(info, f, indent=2)
+    return info
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="cutiefake compile")
+    arg_parser.add_argument('-m', '--model_path', help='model path (words.csv, decoder.mdl, dnn.mdl)', required=True)
+    arg_parser.add_argument('-o', '--output_path', help='output bundle path', required=True)
+    arg_parser.add_argument('-d', '--device', help='device for decoding and scoring', default='cpu')
+    arg_parser.add_argument('--no_script', help='do not export TorchScript scorer', action='store_true')
+    args = arg_parser.parse_args(argv)
+
+    info = compile_bundle(args.model_path, args.output_path, args.device, not args.no_script)
+    print("bundle output end (%d words, version %s)" % (info["words"], info["version"]))
+
+
+if __name__ == "__main__":
+    main()
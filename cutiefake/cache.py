@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+ENTRY_OVERHEAD = 256  # 1エントリあたりの管理領域 (概算)
+SEGMENT_OVERHEAD = 64  # 1文節あたりの管理領域 (概算)
+
+
+def candidates_size(in_str, candidates):
+    """ 変換結果のメモリ使用量 (概算)
+
+    :param in_str: 変換前テキスト
+    :param candidates: 変換候補のリスト
+    :return: バイト数
+    """
+    size = ENTRY_OVERHEAD + len(in_str.encode("utf-8"))
+    for candidate in candidates:
+        size += ENTRY_OVERHEAD + len(candidate["out_str"].encode("utf-8")) * 2
+        size += SEGMENT_OVERHEAD * len(candidate["segments"])
+    return size
+
+
+class LRUCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        """ LRUキャッシュ (スレッドセーフ)
+
+        :param max_entries: 最大エントリ数
+        :param max_bytes: 最大バイト数 (概算)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """ 取得
+
+        :param key:
+        :return: 値、存在しない場合はNone
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        """ 登録
+
+        :param key:
+        :param value:
+        :param size: 値のバイト数 (概算)
+        :return:
+        """
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+
+            # 古いものから削除
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, old_size) = self.entries.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+
+    def clear(self):
+        """ 全削除
+
+        :return:
+        """
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """ 統計情報取得
+
+        :return:
+        """
+        with self.lock:
+            return {"entries": len(self.entries),
+                    "bytes": self.bytes,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions}
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import sys
+import importlib
+
+# サブコマンドと実行モジュールの対応
+COMMANDS = {
+    "serve": "cutiefake.server",
+    "compile": "cutiefake.bundle",
+    "bench": "cutiefake.bench",
+    "quant-eval": "cutiefake.quant_eval",
+}
+
+
+def main(argv=None):
+    """ cutiefake コマンド
+
+    サブコマンド省略時は従来通りサーバーとして起動する
+
+    :param argv:
+    :return:
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) > 0 and argv[0] in COMMANDS:
+        module = importlib.import_module(COMMANDS[argv[0]])
+        argv = argv[1:]
+    else:
+        module = importlib.import_module(COMMANDS["serve"])
+    module.main(argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,52 +22,129 @@
 """
 import os
 import csv
+import hashlib
 import argparse
-import marisa_trie
+import json
 import numpy as np
 import torch
-import torch.nn as nn
-from cutiefake.words import Words
 from cutiefake.model import BertDecoder, ELilyModel
+from cutiefake.emb_table import decode_codes, load_table, load_costs, DECODED_EMB_FILE, STANDALONE_COST_FILE
+from cutiefake.scorer import Scorer, score_table, quantize_model, get_device, DEVICE_CHOICES
+from cutiefake.lattice import Lattice, ID_UNKNOWN
+from cutiefake.trace import Tracer
+from cutiefake.bundle import Bundle, is_bundle, make_reading_index
 
 
 BERT_EMB_DIM = 768
-COST_TMP_MAX = 99  # dummy
-ID_TMP_MAX = -1  # dummy
+DEFAULT_BEAM_WIDTH = 8
+DEFAULT_N_BEST = 10
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_MAX_CANDIDATES = None
 
 
 class Converter:
-    def __init__(self, model_path):
+    def __init__(self, model_path, beam_width=DEFAULT_BEAM_WIDTH, device="auto", num_threads=None,
+                 max_candidates=DEFAULT_MAX_CANDIDATES, quantize=False, tracer=None, script=True):
         """ 変換モジュール
 
-        :param model_path:
+        :param model_path: モデルパス (モデルディレクトリ or コンパイル済みバンドル)
+        :param beam_width: ビーム幅 (終了位置ごとに保持する候補パス数)
+        :param device: 使用デバイス ("auto" or "cpu" or "cuda")
+        :param num_threads: CPU推論時のスレッド数 (intra-op)、Noneの場合はtorchの既定値
+        :param max_candidates: 読みごとの候補数上限 (単体コストの低い順)、Noneの場合は上限なし
+        :param quantize: int8 動的量子化したモデルで推論する場合はTrue (CPUのみ)
+        :param tracer: フェーズ別計測 (Noneの場合は計測しない)
+        :param script: バンドルのTorchScriptグラフ (scorer.pt) を使用する場合はTrue (CPUのみ)
+                       scorer.pt はメモリマップされないため、プロセス間で重みを共有する場合はFalse
         """
-        self.words = []
-        trie_keys = []
-        trie_values = []
-        self.loss = nn.MSELoss()
+        self.beam_width = beam_width
+        self.tracer = tracer
+        # 探索ごとにラティスの大きさ (テキスト数, 文字数, ノード数, 候補パス数, 展開した終了位置数) を渡す関数
+        self.lattice_listener = None
+        self.max_candidates = max_candidates
+        self.quantize = quantize
+        self.device = get_device(device)
+        if quantize and self.device != "cpu":
+            raise ValueError("int8 quantization is only supported on cpu")
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
 
         model_path = os.path.abspath(model_path)
+        if is_bundle(model_path):
+            # コンパイル済みバンドル (メモリマップで読み込み)
+            bundle = Bundle(model_path)
+            self.version = bundle.version
+            self.trie = bundle.trie
+            self.surfaces = bundle.surfaces
+            self.emb_table = bundle.emb_table
+            self.cand_offsets = bundle.cand_offsets
+            self.cand_ids = bundle.cand_ids
+            if script and self.device == "cpu" and not quantize and bundle.has_scorer():
+                # TorchScript出力済みのグラフを使用するため、Pythonのモデルは構築しない
+                self.e_model = None
+                self.scorer = bundle.load_scorer()
+            else:
+                self.e_model = bundle.load_dnn(self.device, quantize)
+                self.scorer = Scorer(self.e_model, self.device)
+        else:
+            self.load_model_dir(model_path)
+
+        # 量子化モデルは変換結果が変わりうるため、キャッシュ等で区別できるようバージョンを分ける
+        if quantize:
+            self.version += "+int8"
+
+    def load_model_dir(self, model_path):
+        """ モデルディレクトリ (words.csv, decoder.mdl, dnn.mdl) 読み込み
+
+        :param model_path:
+        :return:
+        """
+        self.surfaces = []
+        codes = []
+        readings = []
+
+        # モデルバージョン (パスと各ファイルの更新日時から算出)
+        version = hashlib.sha1(model_path.encode("utf-8"))
+        for file_name in ["words.csv", "decoder.mdl", "dnn.mdl", DECODED_EMB_FILE, STANDALONE_COST_FILE]:
+            file_path = model_path + "/" + file_name
+            if os.path.isfile(file_path):
+                version.update(("%s:%f" % (file_name, os.path.getmtime(file_path))).encode("utf-8"))
+        self.version = version.hexdigest()
+
         with open(model_path + "/words.csv", "r") as f:
             reader = csv.reader(f, delimiter=",", doublequote=True, quotechar='"')
-            for i, row in enumerate(reader):
-                # TrieのKeyには読み、Valueには単語ID（リストインデックス）を格納
-                trie_keys.append(row[1])
-                trie_values.append([i])
-                # 単語IDに対応したデータをリストへ格納
-                self.words.append({"w": row[0], "e": np.array([float(row[2])], dtype=np.float32)})
-
-        self.trie = marisa_trie.RecordTrie("<I", zip(trie_keys, trie_values))
-        self.word_info = Words()
-
-        self.b_model = BertDecoder().to("cuda")
-        self.b_model.load_state_dict(torch.load(model_path + "/decoder.mdl"))
-        self.b_model.eval()
-
-        self.e_model = ELilyModel().to("cuda")
-        self.e_model.load_state_dict(torch.load(model_path + "/dnn.mdl"))
+            for row in reader:
+                # 単語ID（リストインデックス）に対応したデータをリストへ格納
+                self.surfaces.append(row[0])
+                readings.append(row[1])
+                codes.append(float(row[2]))
+
+        # デコード済み埋め込みテーブル (単語ID x 768)
+        # 事前生成されていない (または words.csv と行数が合わない) 場合のみ、ここでデコーダを実行して生成する
+        self.emb_table = load_table(model_path)
+        if self.emb_table is None or len(self.emb_table) != len(codes):
+            b_model = BertDecoder().to(self.device)
+            b_model.load_state_dict(torch.load(model_path + "/decoder.mdl", map_location=self.device))
+            b_model.eval()
+            # デコーダは入力がスカラーのため、量子化するとテーブルが潰れる (量子化はスコア算出のみに適用)
+            self.emb_table = decode_codes(b_model, codes, device=self.device)
+
+        self.e_model = ELilyModel().to(self.device)
+        self.e_model.load_state_dict(torch.load(model_path + "/dnn.mdl", map_location=self.device))
         self.e_model.eval()
-        self.criterion = nn.MSELoss()
+        self.scorer = Scorer(self.e_model, self.device)
+
+        # 読みごとの候補リスト (単体コストの低い順)
+        # 単体コストが事前生成されていない場合のみ、ここで全単語分を算出する
+        costs = load_costs(model_path)
+        if costs is None or len(costs) != len(codes):
+            costs = score_table(self.scorer, self.emb_table)
+        self.trie, self.cand_offsets, self.cand_ids = make_reading_index(readings, costs)
+
+        # 候補の並び順はバンドルと揃えるため、単体コスト算出後に量子化する
+        if self.quantize:
+            self.e_model = quantize_model(self.e_model)
+            self.scorer = Scorer(self.e_model, self.device)
 
     def __call__(self, in_text):
         """ 変換
@@ -80,95 +157,236 @@ class Converter:
         if in_len <= 1:
             return in_text
 
-        print("1:")
-        # 変換前のテキストを分解して終了位置ごとにリストでまとめる
-        nodes_set = [[] for _ in range(in_len)]
-        for i in range(in_len):
-            for prefix in self.trie.prefixes(in_text[i:]):
-                nodes_set[i + len(prefix) - 1].append(prefix)
-        print(nodes_set)
-
-        # ノード作成
-        connect_node = []
-        for i in range(len(nodes_set)):
-            min_cost = COST_TMP_MAX
-            min_words = []
-
-            for word in nodes_set[i]:
-                node_len = len(word)
-                connect_index = i - node_len
-                for word_id in self.id_list(word):
-                    words_tmp = [word_id]
-                    print_str = self.words[word_id]["w"]
-
-                    cost_tmp = self.score(words_tmp)
-                    if cost_tmp < min_cost:
-                        min_cost = cost_tmp
-                        min_words = words_tmp
-                        print("[%d] : cost %f / %s" % (i, min_cost, print_str))
-
-                    if connect_index > 0:
-                        words_tmp = connect_node[connect_index]["words"] + [word_id]
-                        print_str = ""
-                        for wordid in words_tmp:
-                            print_str += self.words[wordid]["w"]
-
-                        cost_tmp = self.score(words_tmp)
-                        if cost_tmp < min_cost:
-                            min_cost = cost_tmp
-                            min_words = words_tmp
-                            print("[%d] : cost %f / %s" % (i, min_cost, print_str))
-
-            connect_node.append({"cost": min_cost, "words": min_words})
-
-    def score(self, id_list):
-        """ スコア取得
-
-        :param id_list:
-        :return:
+        return self.convert(in_text, 1)[0]["out_str"]
+
+    def convert(self, in_text, n_best=DEFAULT_N_BEST):
+        """ N-best変換
+
+        :param in_text: 変換前テキスト
+        :param n_best: 取得する変換候補数
+        :return: 変換候補のリスト (コスト昇順)
         """
-        emb = np.zeros(1, dtype=np.float32)
-        emb_tmp = torch.zeros(768, device="cuda")
-        emb_zeros = torch.zeros(768, device="cuda")
-        for word_id in id_list:
-            x_in = torch.from_numpy(self.words[word_id]["e"]).to("cuda")
-            x_emb = self.b_model(x_in)
-            emb_tmp = torch.add(x_emb, emb_tmp)
-        x_emb = torch.cat([emb_tmp, emb_zeros])
-        y = self.e_model(x_emb)
-        score = self.criterion(y, x_emb)
-        return score
-
-    def id_list(self, word):
-        """ TrieIDリスト取得
-
-        :param word:
+        trace = None if self.tracer is None else self.tracer.start()
+        lattice = Lattice(self, in_text)
+        if trace is not None:
+            self.tracer.lap(trace, "lattice")
+        ret = self.search(lattice, n_best, trace=trace)
+        if trace is not None:
+            self.tracer.finish(trace)
+        return ret
+
+    def session(self):
+        """ インクリメンタル変換セッション生成
+
         :return:
         """
+        return ConvertSession(self)
+
+    def convert_batch(self, in_texts, n_best=1, batch_size=DEFAULT_BATCH_SIZE):
+        """ 一括N-best変換
+
+        batch_size件ずつ同時にビームサーチを進め、各終了位置のコストを1回の順伝搬でまとめて算出する
+
+        :param in_texts: 変換前テキストのリスト
+        :param n_best: 取得する変換候補数
+        :param batch_size: 同時に処理するテキスト数
+        :return: 変換候補のリストのリスト (入力と同じ順)
+        """
         ret = []
-        for word_id in self.trie.get(word):
-            ret.append(word_id[0])
+        for i in range(0, len(in_texts), batch_size):
+            trace = None if self.tracer is None else self.tracer.start()
+            lattices = [Lattice(self, in_text) for in_text in in_texts[i:i + batch_size]]
+            if trace is not None:
+                self.tracer.lap(trace, "lattice")
+            ret.extend(self.search_batch(lattices, n_best, trace=trace))
+            if trace is not None:
+                self.tracer.finish(trace)
+        return ret
+
+    def search(self, lattice, n_best=DEFAULT_N_BEST, cancel=None, trace=None):
+        """ ビームサーチ
+
+        算出済みのビームは再利用し、未算出の終了位置のみ処理する
+
+        :param lattice: ラティス
+        :param n_best: 取得する変換候補数
+        :param cancel: 中断判定関数 (終了位置ごとに呼び出し、Trueの場合は中断)
+        :param trace: 計測結果 (Tracer.start() の戻り値、Noneの場合は計測しない)
+        :return: 変換候補のリスト (コスト昇順)、中断した場合はNone
+        """
+        return self.search_batch([lattice], n_best, cancel, trace)[0]
+
+    def search_batch(self, lattices, n_best=DEFAULT_N_BEST, cancel=None, trace=None):
+        """ 複数ラティスのビームサーチ
+
+        :param lattices: ラティスのリスト
+        :param n_best: 取得する変換候補数
+        :param cancel: 中断判定関数 (終了位置ごとに呼び出し、Trueの場合は中断)
+        :param trace: 計測結果 (Tracer.start() の戻り値、Noneの場合は計測しない)
+        :return: ラティスごとの変換候補のリスト、中断した場合はNoneのリスト
+        """
+        for lattice in lattices:
+            # 最終位置のみ、N-best分の候補を残すようにビーム幅を広げるため、常に再算出する
+            lattice.truncate(max(len(lattice) - 1, 0))
+
+        chars = sum([len(lattice) for lattice in lattices])
+        nodes = sum([len(lattice.word_ids) for lattice in lattices])
+        candidates = 0
+        positions = 0
+        if trace is not None:
+            trace["texts"] += len(lattices)
+            trace["chars"] += chars
+            trace["nodes"] += nodes
+
+        # 終了位置ごとに候補パスを全て集め、全ラティス分を1回の順伝搬でまとめてコストを算出する
+        active = [lattice for lattice in lattices if len(lattice.beams) < len(lattice)]
+        while len(active) > 0:
+            # 中断しても算出済みのビームは有効なため、次回の変換で再利用される
+            if cancel is not None and cancel():
+                return [None] * len(lattices)
+
+            expanded = [lattice.expand(len(lattice.beams)) for lattice in active]
+            phase_emb = np.concatenate([embs for _, embs in expanded])
+            candidates += len(phase_emb)
+            positions += len(active)
+            if trace is not None:
+                self.tracer.lap(trace, "expand")
+                trace["candidates"] += len(phase_emb)
+                trace["positions"] += len(active)
+            costs = self.scores(phase_emb)
+            if trace is not None:
+                self.tracer.lap(trace, "score")
+
+            offset = 0
+            for lattice, (paths, embs) in zip(active, expanded):
+                i = len(lattice.beams)
+                in_len = len(lattice)
+                beam_width = self.beam_width if i < in_len - 1 else max(self.beam_width, n_best)
+                lattice.update(i, paths, embs, costs[offset:offset + len(embs)], beam_width)
+                offset += len(embs)
+
+            active = [lattice for lattice in active if len(lattice.beams) < len(lattice)]
+            if trace is not None:
+                self.tracer.lap(trace, "update")
+
+        ret = [lattice.n_best(n_best) for lattice in lattices]
+        if trace is not None:
+            self.tracer.lap(trace, "backtrace")
+        if self.lattice_listener is not None:
+            self.lattice_listener(len(lattices), chars, nodes, candidates, positions)
         return ret
 
-    def vector(self, word_id):
-        """ DNN用単語ベクトル取得
+    def scores(self, phase_emb):
+        """ スコア一括取得
+
+        :param phase_emb: 文節埋め込み (K x 768)
+        :return: 文節ごとのスコア
+        """
+        if len(phase_emb) == 0:
+            return np.zeros(0, dtype=np.float32)
+        return self.scorer(torch.from_numpy(phase_emb)).to("cpu").numpy()
+
+    def word_embs(self, word_ids):
+        """ 単語の埋め込み一括取得
+
+        :param word_ids: 単語ID配列
+        :return: デコード済み埋め込み (N x 768、辞書に無い文字はゼロ)
+        """
+        unknown = word_ids == ID_UNKNOWN
+        embs = self.emb_table[np.where(unknown, 0, word_ids)]
+        embs[unknown] = 0.
+        return embs
+
+    def surface(self, word_id):
+        """ 表記取得
 
         :param word_id:
         :return:
         """
-        id_list = self.words[word_id]
-        return self.word_info(id_list[1], id_list[2], id_list[3])
+        return self.surfaces[word_id]
+
+    def candidates(self, key_ids):
+        """ 読みのキーIDから単語ID配列を一括取得
+
+        :param key_ids: 読みトライのキーID配列 (ID_UNKNOWN の場合は辞書に無い文字)
+        :return: (単語ID配列, キーIDごとの単語数)
+        """
+        known = key_ids != ID_UNKNOWN
+        safe_ids = np.where(known, key_ids, 0)
+        lo = self.cand_offsets[safe_ids]
+        counts = self.cand_offsets[safe_ids + 1] - lo
+        if self.max_candidates is not None:
+            counts = np.minimum(counts, self.max_candidates)
+        # 辞書に無い文字は ID_UNKNOWN を1件とする
+        counts = np.where(known, counts, 1)
+
+        owners = np.repeat(np.arange(len(key_ids)), counts)
+        ranks = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+        word_ids = np.full(len(owners), ID_UNKNOWN, dtype=np.int64)
+        hit = known[owners]
+        word_ids[hit] = self.cand_ids[lo[owners[hit]] + ranks[hit]]
+        return word_ids, counts
+
+
+class ConvertSession:
+    def __init__(self, converter):
+        """ インクリメンタル変換セッション
+
+        IMEのように入力が1文字ずつ伸びる場合、前回のラティスとビームを再利用して
+        新しく追加された終了位置のみを展開・スコアリングする
+
+        :param converter: 変換モジュール
+        """
+        self.converter = converter
+        self.lattice = Lattice(converter)
+
+    def __call__(self, in_text, n_best=DEFAULT_N_BEST, cancel=None):
+        """ N-best変換
+
+        :param in_text: 変換前テキスト (入力中の文字列全体)
+        :param n_best: 取得する変換候補数
+        :param cancel: 中断判定関数
+        :return: 変換候補のリスト (コスト昇順)、中断した場合はNone
+        """
+        tracer = self.converter.tracer
+        trace = None if tracer is None else tracer.start()
+        self.lattice.extend(in_text)
+        if trace is not None:
+            tracer.lap(trace, "lattice")
+        ret = self.converter.search(self.lattice, n_best, cancel, trace)
+        if trace is not None:
+            tracer.finish(trace)
+        return ret
+
+    def reset(self):
+        """ セッション初期化
+
+        :return:
+        """
+        self.lattice = Lattice(self.converter)
 
 
 def main():
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('-m', '--model_path', help='model path', required=True)
     arg_parser.add_argument('-t', '--text', help='pre text', required=True)
+    arg_parser.add_argument('-n', '--n_best', help='number of candidates', type=int, default=1)
+    arg_parser.add_argument('-b', '--beam_width', help='beam width', type=int, default=DEFAULT_BEAM_WIDTH)
+    arg_parser.add_argument('-d', '--device', help='device', choices=DEVICE_CHOICES, default='auto')
+    arg_parser.add_argument('--threads', help='intra-op thread num (CPU)', type=int, default=None)
+    arg_parser.add_argument('-k', '--max_candidates', help='max candidates per reading', type=int,
+                            default=DEFAULT_MAX_CANDIDATES)
+    arg_parser.add_argument('-q', '--quantize', help='int8 dynamic quantization (CPU)', action='store_true')
+    arg_parser.add_argument('--trace', help='print per-phase timing', action='store_true')
     args = arg_parser.parse_args()
 
-    converter = Converter(args.model_path)
-    ret = converter(args.text)
-    print(ret)
+    converter = Converter(args.model_path, args.beam_width, args.device, args.threads, args.max_candidates,
+                          args.quantize, Tracer() if args.trace else None)
+    for candidate in converter.convert(args.text, args.n_best):
+        segments = [segment["out_str"] for segment in candidate["segments"]]
+        print("%f / %s" % (candidate["cost"], " | ".join(segments)))
+    if converter.tracer is not None:
+        print(json.dumps(converter.tracer.recent(1)[0], indent=2))
 
 
 if __name__ == "__main__":
@@ -25,31 +25,53 @@ import csv
 import argparse
 import glob
 import torch
-import pickle
 from tqdm import tqdm
 from transformers import BertTokenizer, BertModel
 from cutiefake.model import BertEncoder
+from cutiefake.scorer import get_device, DEVICE_CHOICES
+from cutiefake.emb_store import EmbStoreWriter, DTYPE_CHOICES
+
+DEFAULT_BATCH_SIZE = 256
+WORD_EMB_STORE = "word_emb"
 
 
 class MecabDicReader:
-    def __init__(self, in_csv_dir, out_csv_dir, elily_model_path, bert_model_path):
+    def __init__(self, in_csv_dir, out_csv_dir, elily_model_path, bert_model_path, device="auto",
+                 batch_size=DEFAULT_BATCH_SIZE, dtype="float32", append=False):
+        """ MeCab辞書CSVから単語のBERT埋め込みを生成
+
+        :param in_csv_dir: MeCab辞書CSVのディレクトリ
+        :param out_csv_dir: 出力ディレクトリ
+        :param elily_model_path: モデルパス (encoder.mdl)
+        :param bert_model_path: BERT事前学習モデルパス
+        :param device: 使用デバイス ("auto" or "cpu" or "cuda")
+        :param batch_size: BERTへ一度に入力する単語数
+        :param dtype: 埋め込みストアへの保存時の型 ("float32" or "float16")
+        :param append: 既存の埋め込みストアへの追記有無 (指定しない場合は作り直す)
+        """
         self.in_csv_dir = os.path.abspath(in_csv_dir)
         self.out_csv_dir = os.path.abspath(out_csv_dir + "/")
+        self.device = get_device(device)
+        self.batch_size = batch_size
+        self.dtype = dtype
+        self.append = append
 
         # BERT pre_trained model load
         self.bert_pre_trained_model = BertModel.from_pretrained(bert_model_path)
-        self.bert_pre_trained_model.to("cuda").eval()
+        self.bert_pre_trained_model.to(self.device).eval()
+        self.max_tokens = self.bert_pre_trained_model.config.max_position_embeddings
 
         # for Tokenizer
         vocab_file_path = bert_model_path + "/vocab.txt"
         self.bert_tokenizer = BertTokenizer(vocab_file_path, do_lower_case=False, do_basic_tokenize=False)
 
         self.encoder = BertEncoder()
-        self.encoder.load_state_dict(torch.load(elily_model_path + "/encoder.mdl"))
-        self.encoder.to("cuda").eval()
+        self.encoder.load_state_dict(torch.load(elily_model_path + "/encoder.mdl", map_location=self.device))
+        self.encoder.to(self.device).eval()
 
     def __call__(self):
-        word_list_from_dic = []
+        # 表記ごとの読み (同じ表記・読みの組は1つにまとめる)
+        readings = {}
 
         print("Mecab dictionary reading...")
         csv_list = glob.glob(self.in_csv_dir + "/*.csv")
@@ -58,21 +80,55 @@ class MecabDicReader:
             with open(csv_file, "r") as f:
                 reader = csv.reader(f, delimiter=",")
                 for row in reader:
-                    word_list_from_dic.append([row[0], row[9]])
-
-        with open("word_emb.pkl", "wb") as f:
-            for word in tqdm(word_list_from_dic):
-                try:
-                    bert_tokens = self.bert_tokenizer.tokenize(word[0])
-                    ids = self.bert_tokenizer.convert_tokens_to_ids(bert_tokens)
-                    tokens_tensor = torch.tensor(ids).unsqueeze(0).to("cuda")
-                    emb, _ = self.bert_pre_trained_model(tokens_tensor)
-                    emb = torch.sum(emb[0].T, 1).detach().to("cpu").numpy()
-                    pickle.dump([word[0], word[1], emb], f)
-                except Exception as e:
-                    print(e)
-                    print("[err] %s / %s" % (word[0], word[1]))
-                    continue
+                    surface_readings = readings.setdefault(row[0], [])
+                    if row[9] not in surface_readings:
+                        surface_readings.append(row[9])
+
+        # 埋め込みは表記ごとに1回だけ算出する
+        surfaces = []
+        token_ids = []
+        for surface in readings:
+            ids = self.bert_tokenizer.convert_tokens_to_ids(self.bert_tokenizer.tokenize(surface))
+            if len(ids) == 0 or len(ids) > self.max_tokens:
+                print("[err] %s / %s" % (surface, readings[surface][0]))
+                continue
+            surfaces.append(surface)
+            token_ids.append(ids)
+
+        # トークン長順に並べ、長さの近い単語同士でバッチを組んでパディングを減らす
+        order = sorted(range(len(surfaces)), key=lambda i: len(token_ids[i]))
+        store_path = self.out_csv_dir + "/" + WORD_EMB_STORE
+        with EmbStoreWriter(store_path, dtype=self.dtype, append=self.append) as writer:
+            for start in tqdm(range(0, len(order), self.batch_size)):
+                batch = order[start:start + self.batch_size]
+                embs = self.embed([token_ids[i] for i in batch])
+
+                # 読みが複数ある表記は同じ埋め込みを読みの数だけ出力する
+                rows = [(j, reading) for j, i in enumerate(batch) for reading in readings[surfaces[i]]]
+                writer.append([surfaces[batch[j]] for j, _ in rows], [reading for _, reading in rows],
+                              embs[[j for j, _ in rows]])
+        print("%s output end" % store_path)
+
+    def embed(self, batch_ids):
+        """ BERT埋め込みの一括算出
+
+        :param batch_ids: 単語ごとのトークンIDリスト
+        :return: 単語ごとの埋め込み (トークン方向の和、N x 768)
+        """
+        max_len = max([len(ids) for ids in batch_ids])
+        tokens_tensor = torch.full((len(batch_ids), max_len), self.bert_tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch_ids), max_len), dtype=torch.long)
+        for i, ids in enumerate(batch_ids):
+            tokens_tensor[i, :len(ids)] = torch.tensor(ids)
+            attention_mask[i, :len(ids)] = 1
+
+        with torch.inference_mode():
+            tokens_tensor = tokens_tensor.to(self.device)
+            attention_mask = attention_mask.to(self.device)
+            emb = self.bert_pre_trained_model(tokens_tensor, attention_mask=attention_mask)[0]
+            # パディング位置を除いてトークン方向に和を取る
+            emb = torch.sum(emb * attention_mask.unsqueeze(-1).to(emb.dtype), 1)
+        return emb.to("cpu").numpy()
 
 
 def main():
@@ -81,13 +137,19 @@ def main():
     arg_parser.add_argument('-o', '--out_path', help='output path', required=True)
     arg_parser.add_argument('-m', '--model_path', help='model path', required=True)
     arg_parser.add_argument('-b', '--bert_path', help='model path', required=True)
+    arg_parser.add_argument('-d', '--device', help='device', choices=DEVICE_CHOICES, default='auto')
+    arg_parser.add_argument('--batch_size', help='words per BERT batch', type=int, default=DEFAULT_BATCH_SIZE)
+    arg_parser.add_argument('--threads', help='intra-op thread num (CPU)', type=int, default=None)
+    arg_parser.add_argument('--dtype', help='stored embedding dtype', choices=DTYPE_CHOICES, default='float32')
+    arg_parser.add_argument('--append', help='append to an existing embedding store', action='store_true')
     args = arg_parser.parse_args()
 
-    reader = MecabDicReader(args.in_path, args.out_path, args.model_path, args.bert_path)
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    reader = MecabDicReader(args.in_path, args.out_path, args.model_path, args.bert_path, args.device,
+                            args.batch_size, args.dtype, args.append)
     reader()
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import os
+import glob
+import json
+import shutil
+import pickle
+import argparse
+import numpy as np
+from tqdm import tqdm
+from cutiefake.model import BERT_EMB_DIM
+from cutiefake.emb_table import SurfaceTable
+
+STORE_FORMAT = 1
+STORE_FILE = "store.json"
+EMB_SHARD_FILE = "emb_%05d.npy"
+SURFACE_FILE = "surfaces_%05d.npy"
+SURFACE_OFFSET_FILE = "surface_offsets_%05d.npy"
+READING_FILE = "readings_%05d.npy"
+READING_OFFSET_FILE = "reading_offsets_%05d.npy"
+DTYPE_CHOICES = ["float32", "float16"]
+DEFAULT_SHARD_ROWS = 65536
+TMP_SUFFIX = ".tmp"
+LINK_STORE_DIR = "link_cache"
+LINK_STORE_FILE = "link.json"
+LINK_EMB_FILE = "link_emb.bin"
+LINK_EMB_DIM = BERT_EMB_DIM * 2
+
+
+def is_store(path):
+    """ 埋め込みストアか判定
+
+    :param path: パス
+    :return:
+    """
+    return os.path.isfile(os.path.join(path, STORE_FILE))
+
+
+def save_strings(blob_file, offset_file, strings):
+    """ 文字列テーブル (UTF-8の連結バイト列とオフセット) を保存
+
+    :param blob_file: 連結バイト列の出力ファイル
+    :param offset_file: オフセットの出力ファイル
+    :param strings: 文字列のリスト
+    :return:
+    """
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(string) for string in encoded])
+    np.save(blob_file, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(offset_file, offsets)
+
+
+class EmbStoreWriter:
+    def __init__(self, path, dim=BERT_EMB_DIM, dtype="float32", shard_rows=DEFAULT_SHARD_ROWS, append=False):
+        """ 埋め込みストアの書き込み
+
+        shard_rows 行ごとにシャードとして出力し、その都度 store.json を更新する
+        新規作成時は一時ディレクトリ (path.tmp) へ出力し、close() で既存のストアと置き換える
+        append 指定時は既存のストアへ直接追記する (次元数・型が既存のストアと異なる場合はエラー)
+
+        :param path: 出力ディレクトリ
+        :param dim: 埋め込みの次元数
+        :param dtype: 保存時の型 ("float32" or "float16")
+        :param shard_rows: シャードあたりの行数
+        :param append: 既存のストアへの追記有無
+        """
+        self.out_path = os.path.abspath(path)
+        self.shard_rows = shard_rows
+        if append and is_store(self.out_path):
+            self.path = self.out_path
+            with open(os.path.join(self.path, STORE_FILE), "r") as f:
+                self.info = json.load(f)
+            if self.info["dim"] != dim or self.info["dtype"] != dtype:
+                raise ValueError("embedding store mismatch: %s is dim=%d dtype=%s (requested dim=%d dtype=%s)"
+                                 % (self.out_path, self.info["dim"], self.info["dtype"], dim, dtype))
+        else:
+            self.path = self.out_path if append else self.out_path + TMP_SUFFIX
+            if not append and os.path.isdir(self.path):
+                # 前回中断時の一時ディレクトリは破棄する
+                shutil.rmtree(self.path)
+            os.makedirs(self.path, exist_ok=True)
+            self.info = {"format": STORE_FORMAT, "dim": dim, "dtype": dtype, "rows": 0, "shards": []}
+            self.save_info()
+        self.surfaces = []
+        self.readings = []
+        self.embs = []
+        self.buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # 例外時は一時ディレクトリのまま残し、既存のストアは置き換えない
+        if exc_type is None:
+            self.close()
+
+    def save_info(self):
+        """ store.json の出力
+
+        :return:
+        """
+        with open(os.path.join(self.path, STORE_FILE), "w") as f:
+            json.dump(self.info, f, indent=2)
+
+    def append(self, surfaces, readings, embs):
+        """ 追記
+
+        :param surfaces: 表記のリスト
+        :param readings: 読みのリスト
+        :param embs: 埋め込み (N x dim)
+        :return:
+        """
+        self.surfaces.extend(surfaces)
+        self.readings.extend(readings)
+        self.embs.append(np.asarray(embs, dtype=self.info["dtype"]).reshape(-1, self.info["dim"]))
+        self.buffered += len(surfaces)
+        while self.buffered >= self.shard_rows:
+            self.flush(self.shard_rows)
+
+    def flush(self, rows=None):
+        """ バッファをシャードとして出力
+
+        :param rows: 出力する行数 (Noneの場合はバッファ全体)
+        :return:
+        """
+        rows = self.buffered if rows is None else rows
+        if rows == 0:
+            return
+
+        embs = np.concatenate(self.embs) if len(self.embs) > 1 else self.embs[0]
+        shard_id = len(self.info["shards"])
+        np.save(os.path.join(self.path, EMB_SHARD_FILE % shard_id), embs[:rows])
+        save_strings(os.path.join(self.path, SURFACE_FILE % shard_id),
+                     os.path.join(self.path, SURFACE_OFFSET_FILE % shard_id), self.surfaces[:rows])
+        save_strings(os.path.join(self.path, READING_FILE % shard_id),
+                     os.path.join(self.path, READING_OFFSET_FILE % shard_id), self.readings[:rows])
+
+        self.surfaces = self.surfaces[rows:]
+        self.readings = self.readings[rows:]
+        self.embs = [embs[rows:]] if rows < len(embs) else []
+        self.buffered -= rows
+
+        # シャードを書き終えてから登録するため、中断しても出力済みのシャードは有効
+        self.info["shards"].append({"id": shard_id, "rows": rows})
+        self.info["rows"] += rows
+        self.save_info()
+
+    def close(self):
+        """ 残りのバッファを出力し、新規作成時は出力先へ配置
+
+        :return:
+        """
+        self.flush()
+        if self.path != self.out_path:
+            if os.path.isdir(self.out_path):
+                shutil.rmtree(self.out_path)
+            os.rename(self.path, self.out_path)
+            self.path = self.out_path
+
+
+class EmbStore:
+    def __init__(self, path):
+        """ 埋め込みストア (メモリマップで読み込み)
+
+        シャードは最初に参照した時点でメモリマップする
+
+        :param path: ストアのディレクトリ
+        """
+        self.path = os.path.abspath(path)
+        with open(os.path.join(self.path, STORE_FILE), "r") as f:
+            self.info = json.load(f)
+        if self.info["format"] != STORE_FORMAT:
+            raise ValueError("unsupported embedding store format: %s" % self.info["format"])
+
+        self.dim = self.info["dim"]
+        self.starts = np.zeros(len(self.info["shards"]) + 1, dtype=np.int64)
+        self.starts[1:] = np.cumsum([shard["rows"] for shard in self.info["shards"]])
+        self.shards = None
+        self.surfaces = None
+        self.readings = None
+
+    def __getstate__(self):
+        # DataLoaderのワーカーへはパスのみ渡し、ワーカー側でメモリマップし直す
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def open(self):
+        """ シャードのメモリマップ
+
+        :return:
+        """
+        if self.shards is not None:
+            return
+
+        shards = []
+        surfaces = []
+        readings = []
+        for shard in self.info["shards"]:
+            shard_id = shard["id"]
+            shards.append(np.load(os.path.join(self.path, EMB_SHARD_FILE % shard_id), mmap_mode="r"))
+            surfaces.append(SurfaceTable(
+                np.load(os.path.join(self.path, SURFACE_FILE % shard_id), mmap_mode="r"),
+                np.load(os.path.join(self.path, SURFACE_OFFSET_FILE % shard_id), mmap_mode="r")))
+            readings.append(SurfaceTable(
+                np.load(os.path.join(self.path, READING_FILE % shard_id), mmap_mode="r"),
+                np.load(os.path.join(self.path, READING_OFFSET_FILE % shard_id), mmap_mode="r")))
+        self.surfaces = surfaces
+        self.readings = readings
+        self.shards = shards
+
+    def locate(self, idx):
+        """ 行番号からシャードとシャード内の行番号を取得
+
+        :param idx: 行番号
+        :return: (シャード番号, シャード内の行番号)
+        """
+        shard_id = int(np.searchsorted(self.starts, idx, side="right")) - 1
+        return shard_id, idx - int(self.starts[shard_id])
+
+    def __getitem__(self, idx):
+        """ 1行取得
+
+        :param idx: 行番号
+        :return: (表記, 読み, 埋め込み (float32))
+        """
+        self.open()
+        shard_id, row = self.locate(idx)
+        return (self.surfaces[shard_id][row], self.readings[shard_id][row],
+                np.array(self.shards[shard_id][row], dtype=np.float32))
+
+    def batch(self, indices):
+        """ 複数行をまとめて取得
+
+        シャードごとに行番号を昇順に並べてから取り出し、指定順に並べ直す
+
+        :param indices: 行番号のリスト
+        :return: (表記のリスト, 読みのリスト, 埋め込み (N x dim, float32))
+        """
+        self.open()
+        indices = np.asarray(indices, dtype=np.int64)
+        order = np.argsort(indices, kind="stable")
+        sorted_indices = indices[order]
+        shard_ids = np.searchsorted(self.starts, sorted_indices, side="right") - 1
+
+        embs = np.empty((len(indices), self.dim), dtype=np.float32)
+        surfaces = [None] * len(indices)
+        readings = [None] * len(indices)
+        bounds = np.flatnonzero(np.diff(shard_ids)) + 1
+        for begin, end in zip(np.r_[0, bounds], np.r_[bounds, len(indices)]):
+            shard_id = int(shard_ids[begin])
+            rows = sorted_indices[begin:end] - self.starts[shard_id]
+            positions = order[begin:end]
+            embs[positions] = self.shards[shard_id][rows]
+            for position, row in zip(positions.tolist(), rows.tolist()):
+                surfaces[position] = self.surfaces[shard_id][row]
+                readings[position] = self.readings[shard_id][row]
+        return surfaces, readings, embs
+
+
+class LinkStore:
+    def __init__(self, path):
+        """ 係り受け学習データ (文節と係り先の埋め込みを連結済み) の読み込み
+
+        連続した1ファイル (rows x dim) を最初に参照した時点でメモリマップする
+
+        :param path: キャッシュのディレクトリ
+        """
+        self.path = os.path.abspath(path)
+        with open(os.path.join(self.path, LINK_STORE_FILE), "r") as f:
+            self.info = json.load(f)
+        if self.info["format"] != STORE_FORMAT:
+            raise ValueError("unsupported link store format: %s" % self.info["format"])
+
+        self.dim = self.info["dim"]
+        self.rows = self.info["rows"]
+        self.embs = None
+
+    def __getstate__(self):
+        # DataLoaderのワーカーへはパスのみ渡し、ワーカー側でメモリマップし直す
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def __len__(self):
+        return self.rows
+
+    def open(self):
+        """ メモリマップ
+
+        :return:
+        """
+        if self.embs is None and self.rows == 0:
+            # 空のファイルはメモリマップできないため、0行の配列で代用する
+            self.embs = np.zeros((0, self.dim), dtype=np.float32)
+        elif self.embs is None:
+            self.embs = np.memmap(os.path.join(self.path, LINK_EMB_FILE), dtype=np.float32, mode="r",
+                                  shape=(self.rows, self.dim))
+
+    def __getitem__(self, idx):
+        """ 1行取得
+
+        :param idx: 行番号
+        :return: 連結済みの埋め込み (float32)
+        """
+        self.open()
+        return np.array(self.embs[idx])
+
+    def batch(self, indices):
+        """ 複数行をまとめて取得
+
+        :param indices: 行番号のリスト
+        :return: 連結済みの埋め込み (N x dim, float32)
+        """
+        self.open()
+        indices = np.asarray(indices, dtype=np.int64)
+        order = np.argsort(indices, kind="stable")
+        embs = np.empty((len(indices), self.dim), dtype=np.float32)
+        embs[order] = self.embs[indices[order]]
+        return embs
+
+
+def build_link_store(link_files_dir, out_path=None):
+    """ 係り受け学習データ (*.pkl) を連結済みのキャッシュへ変換
+
+    ファイルごとに読み込んで追記するため、メモリ使用量は1ファイル分に収まる
+    追加されたファイルのみ追記し、変換済みのファイルが変更・削除された場合は作り直す
+
+    :param link_files_dir: 係り受け学習データのディレクトリ
+    :param out_path: 出力ディレクトリ (Noneの場合は link_files_dir/link_cache)
+    :return: 出力ディレクトリ
+    """
+    if out_path is None:
+        out_path = os.path.join(link_files_dir, LINK_STORE_DIR)
+    out_path = os.path.abspath(out_path)
+    if not os.path.isdir(out_path):
+        os.makedirs(out_path)
+
+    files = {}
+    for file in sorted(glob.glob(os.path.join(link_files_dir, "*.pkl"))):
+        stat = os.stat(file)
+        files[os.path.basename(file)] = [stat.st_size, stat.st_mtime_ns]
+
+    info = None
+    info_file = os.path.join(out_path, LINK_STORE_FILE)
+    if os.path.isfile(info_file):
+        with open(info_file, "r") as f:
+            info = json.load(f)
+        done = info["files"]
+        if any(files.get(name) != value for name, value in done.items()):
+            info = None
+        elif info["rows"] > 0 and not os.path.isfile(os.path.join(out_path, LINK_EMB_FILE)):
+            info = None
+        elif all(name in done for name in files):
+            return out_path
+    if info is None:
+        info = {"format": STORE_FORMAT, "dim": LINK_EMB_DIM, "dtype": "float32", "rows": 0, "files": {}}
+
+    new_files = [name for name in files if name not in info["files"]]
+    emb_file = os.path.join(out_path, LINK_EMB_FILE)
+    with open(emb_file, "r+b" if info["rows"] > 0 else "wb") as f:
+        # 変換済みの末尾以降 (中断時の書きかけ) は切り捨てる
+        f.truncate(info["rows"] * info["dim"] * 4)
+        f.seek(0, os.SEEK_END)
+        # 追加ファイルがない場合も含め、現在の状態を必ず出力する
+        save_link_info(info_file, info)
+        for name in tqdm(new_files):
+            with open(os.path.join(link_files_dir, name), "rb") as in_f:
+                pkl_data = pickle.load(in_f)
+            if len(pkl_data) > 0:
+                embs = np.empty((len(pkl_data), info["dim"]), dtype=np.float32)
+                embs[:, :BERT_EMB_DIM] = [data[0] for data in pkl_data]
+                embs[:, BERT_EMB_DIM:] = [data[1] for data in pkl_data]
+                f.write(embs.tobytes())
+                f.flush()
+            info["rows"] += len(pkl_data)
+            info["files"][name] = files[name]
+
+            # 書き込み後に登録するため、中断しても変換済みのファイルは有効
+            save_link_info(info_file, info)
+    return out_path
+
+
+def save_link_info(info_file, info):
+    """ link.json の出力
+
+    :param info_file: 出力ファイル
+    :param info: キャッシュの情報
+    :return:
+    """
+    with open(info_file, "w") as f:
+        json.dump(info, f)
+
+
+def read_pickle(pkl_file):
+    """ 旧形式 (word_emb.pkl) の読み込み
+
+    :param pkl_file: 旧形式のファイル
+    :return: [表記, 読み, 埋め込み] のジェネレータ
+    """
+    with open(pkl_file, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                break
+
+
+def convert_pickle(pkl_file, out_path, dtype="float32", shard_rows=DEFAULT_SHARD_ROWS, append=False):
+    """ 旧形式 (word_emb.pkl) を埋め込みストアへ変換
+
+    :param pkl_file: 旧形式のファイル
+    :param out_path: 出力ディレクトリ
+    :param dtype: 保存時の型
+    :param shard_rows: シャードあたりの行数
+    :param append: 既存のストアへの追記有無
+    :return: 変換した行数
+    """
+    rows = 0
+    with EmbStoreWriter(out_path, dtype=dtype, shard_rows=shard_rows, append=append) as writer:
+        for surface, reading, emb in tqdm(read_pickle(pkl_file)):
+            writer.append([surface], [reading], emb[np.newaxis])
+            rows += 1
+    return rows
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('-i', '--in_file', help='legacy word_emb.pkl', required=True)
+    arg_parser.add_argument('-o', '--out_path', help='output embedding store path', required=True)
+    arg_parser.add_argument('--dtype', help='stored dtype', choices=DTYPE_CHOICES, default='float32')
+    arg_parser.add_argument('--shard_rows', help='rows per shard', type=int, default=DEFAULT_SHARD_ROWS)
+    arg_parser.add_argument('--append', help='append to an existing store', action='store_true')
+    args = arg_parser.parse_args()
+
+    rows = convert_pickle(args.in_file, args.out_path, args.dtype, args.shard_rows, args.append)
+    print("embedding store output end (%d rows)" % rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import os
+import csv
+import argparse
+import numpy as np
+import torch
+from cutiefake.model import BertDecoder, BERT_EMB_DIM
+
+DECODED_EMB_FILE = "decoded_emb.npy"
+STANDALONE_COST_FILE = "standalone_cost.npy"
+
+
+class SurfaceTable:
+    def __init__(self, blob, offsets):
+        """ 表記テーブル (UTF-8の連結バイト列とオフセット)
+
+        :param blob: 表記を連結したバイト列 (uint8)
+        :param offsets: 単語IDごとの開始オフセット (N+1)
+        """
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, word_id):
+        start = self.offsets[word_id]
+        end = self.offsets[word_id + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+
+def decode_codes(decoder, codes, batch_size=4096, device="cpu"):
+    """ 単語コードをデコードして埋め込みテーブルを生成
+
+    :param decoder: BertDecoder
+    :param codes: 単語コード (N)
+    :param batch_size: バッチサイズ
+    :param device: 使用デバイス
+    :return: デコード済み埋め込み (N x 768, float32)
+    """
+    codes = np.asarray(codes, dtype=np.float32).reshape(-1, 1)
+    table = np.empty((len(codes), BERT_EMB_DIM), dtype=np.float32)
+    with torch.no_grad():
+        for i in range(0, len(codes), batch_size):
+            x_in = torch.from_numpy(codes[i:i + batch_size]).to(device)
+            table[i:i + batch_size] = decoder(x_in).to("cpu").numpy()
+    return table
+
+
+def read_codes(words_file):
+    """ words.csv から単語コードを読み込み
+
+    :param words_file: words.csv パス
+    :return: 単語コード (N)
+    """
+    codes = []
+    with open(words_file, "r") as f:
+        reader = csv.reader(f, delimiter=",", doublequote=True, quotechar='"')
+        for row in reader:
+            codes.append(float(row[2]))
+    return np.array(codes, dtype=np.float32)
+
+
+def save_table(model_path, table):
+    """ 埋め込みテーブルを保存
+
+    :param model_path: モデルパス
+    :param table: デコード済み埋め込み
+    :return:
+    """
+    np.save(os.path.join(model_path, DECODED_EMB_FILE), table.astype(np.float32, copy=False))
+
+
+def load_table(model_path):
+    """ 埋め込みテーブルをメモリマップで読み込み
+
+    :param model_path: モデルパス
+    :return: デコード済み埋め込み、存在しない場合はNone
+    """
+    table_file = os.path.join(model_path, DECODED_EMB_FILE)
+    if not os.path.isfile(table_file):
+        return None
+    return np.load(table_file, mmap_mode="r")
+
+
+def save_costs(model_path, costs):
+    """ 単語単体のコストを保存
+
+    :param model_path: モデルパス
+    :param costs: 単語IDごとのコスト
+    :return:
+    """
+    np.save(os.path.join(model_path, STANDALONE_COST_FILE), costs.astype(np.float32, copy=False))
+
+
+def load_costs(model_path):
+    """ 単語単体のコストを読み込み
+
+    :param model_path: モデルパス
+    :return: 単語IDごとのコスト、存在しない場合はNone
+    """
+    cost_file = os.path.join(model_path, STANDALONE_COST_FILE)
+    if not os.path.isfile(cost_file):
+        return None
+    return np.load(cost_file, mmap_mode="r")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('-m', '--model_path', help='model path', required=True)
+    arg_parser.add_argument('-w', '--words_file', help='words.csv path (default: <model_path>/words.csv)')
+    args = arg_parser.parse_args()
+
+    model_path = os.path.abspath(args.model_path)
+    words_file = args.words_file if args.words_file is not None else model_path + "/words.csv"
+
+    decoder = BertDecoder()
+    decoder.load_state_dict(torch.load(model_path + "/decoder.mdl", map_location="cpu"))
+    decoder.eval()
+
+    table = decode_codes(decoder, read_codes(words_file))
+    save_table(model_path, table)
+    print("%s output end (%d words)" % (DECODED_EMB_FILE, len(table)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import numpy as np
+
+ID_UNKNOWN = -1  # 辞書に存在しない文字
+
+
+class Lattice:
+    def __init__(self, converter, in_text=""):
+        """ ビームサーチ用ラティス
+
+        ノードは終了位置順に並べた (開始位置, 終了位置, 単語ID) の数値配列で保持する
+        終了位置 i のノードとビームは in_text[:i + 1] のみから決まるため、
+        入力が伸びた場合は共通部分を再利用して差分のみ追加できる
+
+        :param converter: 変換モジュール
+        :param in_text: 変換前テキスト
+        """
+        self.converter = converter
+        self.in_text = ""
+        self.starts = np.zeros(0, dtype=np.int64)
+        self.ends = np.zeros(0, dtype=np.int64)
+        self.word_ids = np.zeros(0, dtype=np.int64)
+        self.end_offsets = np.zeros(1, dtype=np.int64)
+        self.beams = []
+        self.beam_embs = []
+        self.extend(in_text)
+
+    def __len__(self):
+        return len(self.in_text)
+
+    def extend(self, in_text):
+        """ 入力テキストの更新
+
+        前回の入力との共通接頭辞までのノードとビームを残し、それ以降を作り直す
+
+        :param in_text: 変換前テキスト
+        :return: 再利用した位置数
+        """
+        common_len = 0
+        for old_char, new_char in zip(self.in_text, in_text):
+            if old_char != new_char:
+                break
+            common_len += 1
+
+        self.in_text = in_text
+        self.truncate(common_len)
+
+        keep = self.end_offsets[common_len]
+        starts, ends, word_ids = self.build_nodes(common_len)
+        self.starts = np.concatenate([self.starts[:keep], starts])
+        self.ends = np.concatenate([self.ends[:keep], ends])
+        self.word_ids = np.concatenate([self.word_ids[:keep], word_ids])
+        self.end_offsets = np.searchsorted(self.ends, np.arange(len(in_text) + 1))
+        return common_len
+
+    def build_nodes(self, begin):
+        """ 終了位置 begin 以降のノードを生成
+
+        トライの接頭辞探索で得たキーIDから候補の単語IDをまとめて引くため、
+        ノード単位の文字列やリストは生成しない
+
+        :param begin: 生成を開始する終了位置
+        :return: (開始位置, 終了位置, 単語ID) の配列 (終了位置順)
+        """
+        trie = self.converter.trie
+        in_text = self.in_text
+        starts = []
+        ends = []
+        key_ids = []
+        for i in range(len(in_text)):
+            # 終了位置が begin 以降の単語は in_text[i:begin + 1] で始まる
+            if i < begin and not trie.has_keys_with_prefix(in_text[i:begin + 1]):
+                continue
+
+            for prefix, key_id in trie.iter_prefixes_with_ids(in_text[i:]):
+                end = i + len(prefix) - 1
+                if end >= begin:
+                    starts.append(i)
+                    ends.append(end)
+                    key_ids.append(key_id)
+
+            # 辞書に無い文字はそのまま1文字のノードとして扱い、パスが途切れないようにする
+            if i >= begin and in_text[i] not in trie:
+                starts.append(i)
+                ends.append(i)
+                key_ids.append(ID_UNKNOWN)
+
+        word_ids, counts = self.converter.candidates(np.array(key_ids, dtype=np.int64))
+        starts = np.repeat(np.array(starts, dtype=np.int64), counts)
+        ends = np.repeat(np.array(ends, dtype=np.int64), counts)
+
+        # 開始位置順に生成しているため、安定ソートで終了位置内は開始位置順になる
+        order = np.argsort(ends, kind="stable")
+        return starts[order], ends[order], word_ids[order]
+
+    def nodes(self, i=None):
+        """ ノード取得
+
+        :param i: 終了位置 (Noneの場合は全ノード)
+        :return: (開始位置, 単語ID) の配列
+        """
+        if i is None:
+            return self.starts, self.word_ids
+        lo = self.end_offsets[i]
+        hi = self.end_offsets[i + 1]
+        return self.starts[lo:hi], self.word_ids[lo:hi]
+
+    def truncate(self, length):
+        """ 終了位置 length 以降のビームを破棄
+
+        :param length: 残す位置数
+        :return:
+        """
+        del self.beams[length:]
+        del self.beam_embs[length:]
+
+    def expand(self, i):
+        """ 終了位置 i で終わる候補パスを列挙
+
+        各候補パスは (開始位置, 単語ID, 直前のビーム内の順位) の配列で表し、文節埋め込みは
+        直前の候補の累積埋め込みに単語の埋め込みを1回加算して求める
+
+        :param i: 終了位置
+        :return: (候補パス, 文節埋め込み (K x 768))
+        """
+        beam_width = self.converter.beam_width
+        emb_dim = self.converter.emb_table.shape[1]
+        starts, word_ids = self.nodes(i)
+        word_embs = self.converter.word_embs(word_ids)
+
+        path_starts = []
+        path_words = []
+        path_ranks = []
+        embs = []
+        # 開始位置ごとに、直前のビームと単語の全組み合わせをまとめて生成する
+        for start in np.unique(starts):
+            mask = starts == start
+            if start == 0:
+                group_words = word_ids[mask]
+                path_ranks.append(np.full(len(group_words), -1, dtype=np.int64))
+                embs.append(word_embs[mask])
+            else:
+                prev_embs = self.beam_embs[start - 1][:beam_width]
+                prev_num = len(prev_embs)
+                if prev_num == 0:
+                    continue
+                group_words = np.repeat(word_ids[mask], prev_num)
+                path_ranks.append(np.tile(np.arange(prev_num), np.count_nonzero(mask)))
+                embs.append((word_embs[mask][:, np.newaxis] + prev_embs[np.newaxis]).reshape(-1, emb_dim))
+            path_words.append(group_words)
+            path_starts.append(np.full(len(group_words), start, dtype=np.int64))
+
+        if len(embs) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return (empty, empty, empty), np.zeros((0, emb_dim), dtype=np.float32)
+        paths = (np.concatenate(path_starts), np.concatenate(path_words), np.concatenate(path_ranks))
+        return paths, np.concatenate(embs)
+
+    def update(self, i, paths, embs, costs, beam_width):
+        """ コストの低い順にビーム幅分の候補パスを保持
+
+        :param i: 終了位置
+        :param paths: 候補パス (開始位置, 単語ID, 直前のビーム内の順位)
+        :param embs: 候補パスごとの文節埋め込み
+        :param costs: 候補パスごとのコスト
+        :param beam_width: ビーム幅
+        :return:
+        """
+        path_starts, path_words, path_ranks = paths
+        indices = np.argsort(costs, kind="stable")[:beam_width]
+        beam = []
+        for index in indices:
+            start = int(path_starts[index])
+            rank = path_ranks[index]
+            prev = self.beams[start - 1][rank] if rank >= 0 else None
+            beam.append({"cost": float(costs[index]), "prev": prev, "word": int(path_words[index]),
+                         "start": start, "end": i + 1})
+        self.beams.append(beam)
+        self.beam_embs.append(embs[indices])
+
+    def segments(self, hyp):
+        """ 候補パスを文節に分解 (バックポインタを辿る)
+
+        :param hyp: 候補パス
+        :return: 文節のリスト
+        """
+        segments = []
+        while hyp is not None:
+            if hyp["word"] == ID_UNKNOWN:
+                surface = self.in_text[hyp["start"]:hyp["end"]]
+            else:
+                surface = self.converter.surface(hyp["word"])
+            segments.append({"out_str": surface, "start": hyp["start"], "end": hyp["end"]})
+            hyp = hyp["prev"]
+        segments.reverse()
+        return segments
+
+    def n_best(self, n):
+        """ 変換候補を上位 n 件取得
+
+        :param n: 取得件数
+        :return: 変換候補のリスト (コスト昇順)
+        """
+        ret = []
+        out_strs = set()
+        if len(self.beams) == 0:
+            return ret
+
+        for hyp in self.beams[-1]:
+            segments = self.segments(hyp)
+
+            # 同じ変換結果になる候補はコストの低い方のみ残す
+            out_str = "".join([segment["out_str"] for segment in segments])
+            if out_str in out_strs:
+                continue
+            out_strs.add(out_str)
+            ret.append({"out_str": out_str, "cost": hyp["cost"], "segments": segments})
+            if len(ret) >= n:
+                break
+        return ret
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+
+# ヒストグラムのバケット上限 (Prometheus の le)
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.]
+HISTOGRAMS = {
+    "cutiefake_rpc_latency_seconds": LATENCY_BUCKETS,
+    "cutiefake_lattice_chars": [1, 2, 4, 8, 16, 32, 64, 128, 256],
+    "cutiefake_lattice_nodes": [16, 64, 256, 1024, 4096, 16384, 65536],
+    "cutiefake_lattice_candidates": [64, 256, 1024, 4096, 16384, 65536, 262144],
+    "cutiefake_beam_positions": [1, 2, 4, 8, 16, 32, 64, 128, 256],
+}
+# 変換結果キャッシュの累計値 (カウンタとして出力)
+CACHE_COUNTERS = ["hits", "misses", "evictions"]
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metrics:
+    def __init__(self):
+        """ サーバーの稼働状況の集計
+
+        更新はスレッドごとの集計領域 (シャード) に対してのみ行うためロックを取らない
+        ロックはシャードの登録時と集計時のみ使用する
+        """
+        self.start_time = time.time()
+        self.model_load_sec = 0.
+        self.executor = None
+        self.scheduler = None
+        self.cache = None
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+
+    def shard(self):
+        """ 現在のスレッドの集計領域取得
+
+        :return:
+        """
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = {"counters": {}, "hist": {}, "sums": {}}
+            with self.lock:
+                self.shards.append(shard)
+            self.local.shard = shard
+        return shard
+
+    def inc(self, name, label="", value=1):
+        """ カウンタ加算
+
+        :param name: メトリクス名
+        :param label: ラベル (RPC名など)
+        :param value: 加算値
+        :return:
+        """
+        counters = self.shard()["counters"]
+        key = (name, label)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, label=""):
+        """ ヒストグラムへ値を追加
+
+        :param name: メトリクス名 (HISTOGRAMS のキー)
+        :param value: 値
+        :param label: ラベル (RPC名など)
+        :return:
+        """
+        shard = self.shard()
+        key = (name, label)
+        counts = shard["hist"].get(key)
+        if counts is None:
+            counts = [0] * (len(HISTOGRAMS[name]) + 1)
+            shard["hist"][key] = counts
+            shard["sums"][key] = 0.
+        counts[bisect.bisect_left(HISTOGRAMS[name], value)] += 1
+        shard["sums"][key] += value
+
+    @contextmanager
+    def track(self, rpc):
+        """ RPCの処理中件数・レイテンシ・エラー数の計測
+
+        :param rpc: RPC名
+        :return:
+        """
+        self.inc("cutiefake_rpc_started_total", rpc)
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("cutiefake_rpc_errors_total", rpc)
+            raise
+        finally:
+            self.observe("cutiefake_rpc_latency_seconds", time.perf_counter() - start, rpc)
+            self.inc("cutiefake_rpc_finished_total", rpc)
+
+    def observe_lattice(self, texts, chars, nodes, candidates, positions):
+        """ 探索ごとのラティスの大きさを集計 (Converter.lattice_listener)
+
+        :param texts: テキスト数
+        :param chars: 文字数
+        :param nodes: ノード数
+        :param candidates: 候補パス数
+        :param positions: ビームを更新した終了位置数
+        :return:
+        """
+        texts = max(texts, 1)
+        self.observe("cutiefake_lattice_chars", chars / texts)
+        self.observe("cutiefake_lattice_nodes", nodes / texts)
+        self.observe("cutiefake_lattice_candidates", candidates / texts)
+        self.observe("cutiefake_beam_positions", positions / texts)
+
+    def collect(self):
+        """ 全スレッドの集計結果をまとめる
+
+        :return: {"counters": {(名前, ラベル): 値}, "histograms": {(名前, ラベル): (バケットごとの件数, 合計)},
+                  "gauges": {名前: 値}}
+        """
+        with self.lock:
+            shards = list(self.shards)
+
+        counters = {}
+        histograms = {}
+        for shard in shards:
+            for key, value in list(shard["counters"].items()):
+                counters[key] = counters.get(key, 0) + value
+            sums = shard["sums"]
+            for key, counts in list(shard["hist"].items()):
+                total_counts, total_sum = histograms.get(key, ([0] * len(counts), 0.))
+                histograms[key] = ([a + b for a, b in zip(total_counts, counts)], total_sum + sums.get(key, 0.))
+
+        gauges = {"cutiefake_uptime_seconds": time.time() - self.start_time,
+                  "cutiefake_model_load_seconds": self.model_load_sec}
+        in_flight = 0
+        for (name, label), value in counters.items():
+            if name == "cutiefake_rpc_started_total":
+                in_flight += value - counters.get(("cutiefake_rpc_finished_total", label), 0)
+        gauges["cutiefake_rpc_in_flight"] = in_flight
+        if self.executor is not None:
+            # ThreadPoolExecutor の待ちキュー (公開APIが無いため内部属性を参照し、無い場合は出力しない)
+            work_queue = getattr(self.executor, "_work_queue", None)
+            if work_queue is not None and hasattr(work_queue, "qsize"):
+                gauges["cutiefake_executor_queue_length"] = work_queue.qsize()
+        if self.scheduler is not None:
+            gauges["cutiefake_scheduler_queue_length"] = self.scheduler.queue.qsize()
+        if self.cache is not None:
+            for key, value in self.cache.stats().items():
+                if key in CACHE_COUNTERS:
+                    counters[("cutiefake_cache_%s_total" % key, "")] = value
+                else:
+                    gauges["cutiefake_cache_" + key] = value
+        return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+    def prometheus(self):
+        """ Prometheus テキスト形式で出力
+
+        :return:
+        """
+        stats = self.collect()
+        lines = []
+        for name, value in sorted(stats["gauges"].items()):
+            lines.append("# TYPE %s gauge" % name)
+            lines.append("%s %s" % (name, format_value(value)))
+
+        counter_names = sorted(set([name for name, _ in stats["counters"]]))
+        for counter_name in counter_names:
+            lines.append("# TYPE %s counter" % counter_name)
+            for (name, label), value in sorted(stats["counters"].items()):
+                if name == counter_name:
+                    lines.append("%s%s %s" % (name, format_labels(label), format_value(value)))
+
+        histogram_names = sorted(set([name for name, _ in stats["histograms"]]))
+        for histogram_name in histogram_names:
+            lines.append("# TYPE %s histogram" % histogram_name)
+            for (name, label), (counts, total) in sorted(stats["histograms"].items()):
+                if name != histogram_name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(HISTOGRAMS[name] + ["+Inf"], counts):
+                    cumulative += count
+                    lines.append("%s_bucket%s %d" % (name, format_labels(label, bound), cumulative))
+                lines.append("%s_sum%s %s" % (name, format_labels(label), format_value(total)))
+                lines.append("%s_count%s %d" % (name, format_labels(label), cumulative))
+        return "\n".join(lines) + "\n"
+
+
+def format_value(value):
+    """ 値の文字列化
+
+    :param value:
+    :return:
+    """
+    return "%d" % value if isinstance(value, int) else "%.6g" % value
+
+
+def format_labels(label, bound=None):
+    """ ラベルの文字列化
+
+    :param label: RPC名 (空の場合はラベル無し)
+    :param bound: ヒストグラムのバケット上限
+    :return:
+    """
+    labels = []
+    if len(label) > 0:
+        labels.append('rpc="%s"' % label)
+    if bound is not None:
+        labels.append('le="%s"' % (bound if isinstance(bound, str) else format_value(float(bound))))
+    return "{%s}" % ",".join(labels) if len(labels) > 0 else ""
+
+
+def serve_metrics(metrics, port, host="127.0.0.1"):
+    """ Prometheus 形式のメトリクスを HTTP で公開 (/metrics)
+
+    :param metrics: Metrics
+    :param port: ポート番号
+    :param host: 待ち受けアドレス
+    :return: HTTPサーバー (デーモンスレッドで実行)
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
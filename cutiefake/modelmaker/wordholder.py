@@ -20,57 +20,249 @@
  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
  SOFTWARE.
 """
+import os
 import csv
 import marisa_trie
 import numpy as np
 from cutiefake.words import Words
 
+# バイナリ形式のファイル名 (save() で words.csv / words.marisa と同じディレクトリへ出力)
+SURFACE_TRIE_FILE = "holder_surface.marisa"
+READING_TRIE_FILE = "holder_reading.marisa"
+SURFACE_ROW_FILE = "holder_surface_row.npy"
+VEC_ID_FILE = "holder_vec_id.npy"
+TYPE1_FILE = "holder_type1.npy"
+TYPE2_FILE = "holder_type2.npy"
+READING_ID_FILE = "holder_reading_id.npy"
+READING_OFFSET_FILE = "holder_reading_offsets.npy"
+READING_WORD_FILE = "holder_reading_words.npy"
+
 
 class WordHolder:
     def __init__(self, list_file=None):
-        self.word_list = {}
+        """ 単語リスト
+
+        行番号は登録順とし、vec_id / 品詞は列ごとの配列で保持する
+        表記は表記のTrieのキーIDから行番号を引く配列で、読みは読みのTrieのキーIDで保持し、読みから行番号を引く索引を持つ
+
+        :param list_file: words.csv、またはバイナリ形式で保存したディレクトリ (メモリマップで読み込み)
+        """
         self.words_info = Words()
+        self.surface_trie = marisa_trie.Trie()
+        self.reading_trie = marisa_trie.Trie()
+        self.surface_rows = np.zeros(0, dtype=np.uint32)
+        self.vec_ids = np.zeros(0, dtype=np.uint16)
+        self.type1s = np.zeros(0, dtype=np.uint8)
+        self.type2s = np.zeros(0, dtype=np.uint8)
+        self.reading_ids = np.zeros(0, dtype=np.uint32)
+        self.reading_offsets = np.zeros(1, dtype=np.int64)
+        self.reading_words = np.zeros(0, dtype=np.uint32)
+        # 列へ未反映の登録単語 (表記 -> (読み, vec_id, 品詞1, 品詞2)) と、その読みの索引 (読み -> 表記のリスト)
+        # 反映済みの表記を再登録した場合は、build() でその行を上書きする
+        self.row_keys = None
+        self.pending = {}
+        self.pending_readings = {}
+        self.pending_new = 0
+        # 全単語分の単語ベクトル (初回参照時に一括生成、build() で破棄)
+        self.word_vectors = None
 
-        # word file read
         if list_file is not None:
-            with open(list_file, "r", encoding="utf-8") as f:
-                reader = csv.reader(f, delimiter=",")
-                for row in reader:
-                    self.word_list[row[0]] = {"read": row[1], "vec_id": row[2], "type1": row[3], "type2": row[4]}
+            if os.path.isdir(list_file):
+                self.load(list_file)
+            else:
+                with open(list_file, "r", encoding="utf-8") as f:
+                    reader = csv.reader(f, delimiter=",")
+                    for row in reader:
+                        self.add(row[0], row[1], int(row[2]), int(row[3]), int(row[4]))
+                self.build()
+
+    def __len__(self):
+        return len(self.vec_ids) + self.pending_new
+
+    def __contains__(self, surface):
+        return surface in self.pending or surface in self.surface_trie
 
     def __call__(self, surface):
-        return self.words_info(int(self.word_list[surface]["vec_id"]),
-                               int(self.word_list[surface]["type1"]),
-                               int(self.word_list[surface]["type2"]))
+        # 未反映の単語は列を作り直さずにその単語分のみ生成する
+        if surface in self.pending:
+            _, vec_id, type1, type2 = self.pending[surface]
+            return self.words_info.batch([vec_id], [type1], [type2])[0]
+        return self.vectors()[self.surface_rows[self.surface_trie[surface]]]
+
+    def vectors(self):
+        """ 全単語分の単語ベクトル取得
+
+        :return: 単語ベクトル (登録順 x 80)
+        """
+        self.build()
+        if self.word_vectors is None:
+            self.word_vectors = self.words_info.batch(self.vec_ids, self.type1s, self.type2s)
+        return self.word_vectors
+
+    def words(self, read):
+        """ 読みから表記を取得
+
+        :param read: 読み
+        :return: 表記のリスト (登録順)
+        """
+        surfaces = []
+        key_id = self.reading_trie.get(read)
+        if key_id is not None:
+            rows = self.reading_words[self.reading_offsets[key_id]:self.reading_offsets[key_id + 1]]
+            # 再登録して読みが変わる可能性のある単語は未反映側を優先する
+            surfaces = [surface for surface in [self.surface(int(row)) for row in rows] if surface not in self.pending]
+        return surfaces + self.pending_readings.get(read, [])
+
+    def surface(self, row):
+        """ 行番号から表記を取得
+
+        :param row: 行番号
+        :return: 表記
+        """
+        if self.row_keys is None:
+            self.row_keys = np.argsort(self.surface_rows).astype(np.uint32)
+        return self.surface_trie.restore_key(int(self.row_keys[row]))
+
+    def add(self, surface, read, vec_id, type1, type2):
+        """ 単語の追加 (列へは build() で反映)
+
+        登録済みの表記の場合は、その単語の読み・vec_id・品詞を置き換える (行番号は変わらない)
+
+        :param surface: 表記
+        :param read: 読み
+        :param vec_id: vec_id
+        :param type1: 品詞1の番号
+        :param type2: 品詞2の番号
+        :return:
+        """
+        if surface in self.pending:
+            self.pending_readings[self.pending[surface][0]].remove(surface)
+        elif surface not in self.surface_trie:
+            self.pending_new += 1
+        self.pending_readings.setdefault(read, []).append(surface)
+        self.pending[surface] = (read, vec_id, type1, type2)
 
     def regist(self, surface, read, type1, type2):
-        if not surface in self.word_list:
+        if not surface in self:
             vec_id = np.random.randint(0, 65535)
             if type2 != "*":
-                self.word_list[surface] = {"vec_id": vec_id,
-                                           "read": read,
-                                           "type1": self.words_info.word_type_list[0].index(type1),
-                                           "type2": self.words_info.word_type_list[1].index(type2)}
+                self.add(surface, read, vec_id,
+                         self.words_info.word_type_list[0].index(type1),
+                         self.words_info.word_type_list[1].index(type2))
             else:
-                self.word_list[surface] = {"vec_id": vec_id,
-                                           "read": read,
-                                           "type1": self.words_info.word_type_list[0].index(type1),
-                                           "type2": self.words_info.word_type_list[0].index(type1)}
+                self.add(surface, read, vec_id,
+                         self.words_info.word_type_list[0].index(type1),
+                         self.words_info.word_type_list[0].index(type1))
+
+    def build(self):
+        """ 登録単語を列へ反映
+
+        新しい単語は末尾の行へ追加し (行番号は登録順のまま)、登録済みの単語はその行を上書きする
+        Trieは追加できないため、既存の単語と合わせて作り直す
+
+        :return:
+        """
+        if len(self.pending) == 0:
+            return
+
+        surfaces = [self.surface(row) for row in range(len(self.vec_ids))]
+        readings = [self.reading_trie.restore_key(int(i)) for i in self.reading_ids]
+        rows = []
+        for surface in self.pending:
+            key_id = self.surface_trie.get(surface)
+            if key_id is None:
+                rows.append(len(surfaces))
+                surfaces.append(surface)
+                readings.append(None)
+            else:
+                rows.append(int(self.surface_rows[key_id]))
+
+        values = list(self.pending.values())
+        vec_ids = np.zeros(len(surfaces), dtype=np.uint16)
+        type1s = np.zeros(len(surfaces), dtype=np.uint8)
+        type2s = np.zeros(len(surfaces), dtype=np.uint8)
+        vec_ids[:len(self.vec_ids)] = self.vec_ids
+        type1s[:len(self.type1s)] = self.type1s
+        type2s[:len(self.type2s)] = self.type2s
+        vec_ids[rows] = [value[1] for value in values]
+        type1s[rows] = [value[2] for value in values]
+        type2s[rows] = [value[3] for value in values]
+        for row, value in zip(rows, values):
+            readings[row] = value[0]
+        self.vec_ids = vec_ids
+        self.type1s = type1s
+        self.type2s = type2s
+
+        self.surface_trie = marisa_trie.Trie(surfaces)
+        self.surface_rows = np.zeros(len(surfaces), dtype=np.uint32)
+        self.surface_rows[[self.surface_trie[surface] for surface in surfaces]] = np.arange(len(surfaces))
+        self.row_keys = None
+
+        self.reading_trie = marisa_trie.Trie(readings)
+        self.reading_ids = np.array([self.reading_trie[read] for read in readings], dtype=np.uint32)
+        self.reading_words = np.argsort(self.reading_ids, kind="stable").astype(np.uint32)
+        self.reading_offsets = np.zeros(len(self.reading_trie) + 1, dtype=np.int64)
+        self.reading_offsets[1:] = np.cumsum(np.bincount(self.reading_ids, minlength=len(self.reading_trie)))
+        self.pending = {}
+        self.pending_readings = {}
+        self.pending_new = 0
+        self.word_vectors = None
 
     def save(self, out_dir):
+        """ 単語リスト出力
+
+        words.csv / words.marisa (行番号は登録順) と、メモリマップで読み込めるバイナリ形式を出力する
+
+        :param out_dir: 出力ディレクトリ
+        :return:
+        """
+        self.build()
         with open(out_dir + "/words.csv", 'w', encoding="utf-8") as f:
             writer = csv.writer(f, lineterminator='\n')
             trie_keys = []
             trie_values = []
-            for i, [k, v] in enumerate(self.word_list.items()):
-                writer.writerow([k, v["read"], v["vec_id"], v["type1"], v["type2"]])
-                trie_keys.append(v["read"])
-                trie_values.append([i, int(v["vec_id"]), int(v["type1"]), int(v["type2"])])
+            for i in range(len(self.vec_ids)):
+                read = self.reading_trie.restore_key(int(self.reading_ids[i]))
+                vec_id = int(self.vec_ids[i])
+                type1 = int(self.type1s[i])
+                type2 = int(self.type2s[i])
+                writer.writerow([self.surface(i), read, vec_id, type1, type2])
+                trie_keys.append(read)
+                trie_values.append([i, vec_id, type1, type2])
 
         trie = marisa_trie.RecordTrie("<IIHH", zip(trie_keys, trie_values))
         trie.save(out_dir + '/words.marisa')
 
-    def type_list_cnt(self):
-        return [len(self.words_info.word_type_list[0]), len(self.words_info.word_type_list[1])]
+        self.surface_trie.save(out_dir + "/" + SURFACE_TRIE_FILE)
+        self.reading_trie.save(out_dir + "/" + READING_TRIE_FILE)
+        np.save(out_dir + "/" + SURFACE_ROW_FILE, self.surface_rows)
+        np.save(out_dir + "/" + VEC_ID_FILE, self.vec_ids)
+        np.save(out_dir + "/" + TYPE1_FILE, self.type1s)
+        np.save(out_dir + "/" + TYPE2_FILE, self.type2s)
+        np.save(out_dir + "/" + READING_ID_FILE, self.reading_ids)
+        np.save(out_dir + "/" + READING_OFFSET_FILE, self.reading_offsets)
+        np.save(out_dir + "/" + READING_WORD_FILE, self.reading_words)
 
+    def load(self, in_dir):
+        """ バイナリ形式の単語リスト読み込み (メモリマップ)
 
+        :param in_dir: save() の出力ディレクトリ
+        :return:
+        """
+        self.surface_trie = marisa_trie.Trie().mmap(in_dir + "/" + SURFACE_TRIE_FILE)
+        self.reading_trie = marisa_trie.Trie().mmap(in_dir + "/" + READING_TRIE_FILE)
+        self.surface_rows = np.load(in_dir + "/" + SURFACE_ROW_FILE, mmap_mode="r")
+        self.vec_ids = np.load(in_dir + "/" + VEC_ID_FILE, mmap_mode="r")
+        self.type1s = np.load(in_dir + "/" + TYPE1_FILE, mmap_mode="r")
+        self.type2s = np.load(in_dir + "/" + TYPE2_FILE, mmap_mode="r")
+        self.reading_ids = np.load(in_dir + "/" + READING_ID_FILE, mmap_mode="r")
+        self.reading_offsets = np.load(in_dir + "/" + READING_OFFSET_FILE, mmap_mode="r")
+        self.reading_words = np.load(in_dir + "/" + READING_WORD_FILE, mmap_mode="r")
+        self.row_keys = None
+        self.pending = {}
+        self.pending_readings = {}
+        self.pending_new = 0
+        self.word_vectors = None
+
+    def type_list_cnt(self):
+        return [len(self.words_info.word_type_list[0]), len(self.words_info.word_type_list[1])]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import os
+import signal
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from cutiefake.bundle import is_bundle, compile_bundle
+
+# 同じポートを複数プロセスで待ち受ける
+REUSEPORT_OPTIONS = [("grpc.so_reuseport", 1)]
+
+
+def run_worker(args_dict):
+    """ ワーカープロセス
+
+    :param args_dict: コマンドライン引数
+    :return:
+    """
+    from cutiefake.server import serve
+
+    # Ctrl-Cは親プロセスで受け、SIGTERMで停止を通知する
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    serve(argparse.Namespace(**args_dict), REUSEPORT_OPTIONS)
+
+
+def serve_prefork(args):
+    """ マルチプロセスサーバー起動
+
+    各ワーカーはコンパイル済みバンドルをメモリマップで読み込むため、
+    語彙の配列・Trie・重みはページキャッシュ上で共有され、メモリ使用量はほぼ1モデル分に収まる
+
+    :param args: コマンドライン引数
+    :return:
+    """
+    bundle_dir = None
+    if not is_bundle(os.path.abspath(args.model)):
+        bundle_dir = tempfile.mkdtemp(prefix="cutiefake-")
+        print("compile bundle: %s" % bundle_dir)
+        # ワーカーは scorer.pt を読み込まないため、TorchScriptの出力は省略する
+        compile_bundle(args.model, bundle_dir, script=False)
+        args.model = bundle_dir
+
+    # scorer.pt (TorchScript) はメモリマップされずワーカーごとに重みを複製するため、
+    # メモリマップしたバンドルの重みをページキャッシュ上で共有する通常のモデルを使う
+    args.no_script = True
+
+    # 各プロセスのCPU推論スレッド数はコア数を分け合う
+    if args.threads is None:
+        args.threads = max(1, (os.cpu_count() or 1) // args.processes)
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    ctx = multiprocessing.get_context("spawn")
+    # メトリクスのポートはワーカーごとに1つずつずらす
+    procs = [ctx.Process(target=run_worker,
+                         args=(dict(vars(args), metrics_port=args.metrics_port + i if args.metrics_port > 0 else 0),))
+             for i in range(args.processes)]
+    try:
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        for p in procs:
+            p.join()
+        if bundle_dir is not None:
+            shutil.rmtree(bundle_dir, ignore_errors=True)
@@ -1,12 +1,15 @@
+import os
 from grpc.tools import protoc
 
+# パッケージ (cutiefake.proto) としてimportできるよう、リポジトリルートを基準に生成する
+root_dir = os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/../..")
 
 protoc.main(
     (
         '',
-        '-I.',
-        '--python_out=.',
-        '--grpc_python_out=.',
-        './elily.proto',
+        '-I' + root_dir,
+        '--python_out=' + root_dir,
+        '--grpc_python_out=' + root_dir,
+        root_dir + '/cutiefake/proto/elily.proto',
     )
 )
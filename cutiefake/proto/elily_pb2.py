@@ -1,13 +1,22 @@
 # -*- coding: utf-8 -*-
 # Generated by the protocol buffer compiler.  DO NOT EDIT!
-# source: elily.proto
-
-import sys
-_b=sys.version_info[0]<3 and (lambda x:x) or (lambda x:x.encode('latin1'))
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: cutiefake/proto/elily.proto
+# Protobuf Python Version: 7.35.1
+"""Generated protocol buffer code."""
 from google.protobuf import descriptor as _descriptor
-from google.protobuf import message as _message
-from google.protobuf import reflection as _reflection
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
 from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    7,
+    35,
+    1,
+    '',
+    'cutiefake/proto/elily.proto'
+)
 # @@protoc_insertion_point(imports)
 
 _sym_db = _symbol_database.Default()
@@ -15,220 +24,47 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor.FileDescriptor(
-  name='elily.proto',
-  package='elilypb',
-  syntax='proto3',
-  serialized_options=None,
-  serialized_pb=_b('\n\x0b\x65lily.proto\x12\x07\x65lilypb\"\x1c\n\nConvertReq\x12\x0e\n\x06in_str\x18\x01 \x01(\t\".\n\x0b\x43onvertResp\x12\x0e\n\x06status\x18\x01 \x01(\x05\x12\x0f\n\x07out_str\x18\x02 \x01(\t\"#\n\x11PartialConvertReq\x12\x0e\n\x06in_str\x18\x01 \x01(\t\"5\n\x12PartialConvertResp\x12\x0e\n\x06status\x18\x01 \x01(\x05\x12\x0f\n\x07out_str\x18\x02 \x03(\t2\x93\x01\n\x0c\x45LilyService\x12\x36\n\x07\x43onvert\x12\x13.elilypb.ConvertReq\x1a\x14.elilypb.ConvertResp\"\x00\x12K\n\x0ePartialConvert\x12\x1a.elilypb.PartialConvertReq\x1a\x1b.elilypb.PartialConvertResp\"\x00\x62\x06proto3')
-)
-
-
-
-
-_CONVERTREQ = _descriptor.Descriptor(
-  name='ConvertReq',
-  full_name='elilypb.ConvertReq',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='in_str', full_name='elilypb.ConvertReq.in_str', index=0,
-      number=1, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=_b("").decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=24,
-  serialized_end=52,
-)
-
-
-_CONVERTRESP = _descriptor.Descriptor(
-  name='ConvertResp',
-  full_name='elilypb.ConvertResp',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='status', full_name='elilypb.ConvertResp.status', index=0,
-      number=1, type=5, cpp_type=1, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='out_str', full_name='elilypb.ConvertResp.out_str', index=1,
-      number=2, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=_b("").decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=54,
-  serialized_end=100,
-)
-
-
-_PARTIALCONVERTREQ = _descriptor.Descriptor(
-  name='PartialConvertReq',
-  full_name='elilypb.PartialConvertReq',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='in_str', full_name='elilypb.PartialConvertReq.in_str', index=0,
-      number=1, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=_b("").decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=102,
-  serialized_end=137,
-)
-
-
-_PARTIALCONVERTRESP = _descriptor.Descriptor(
-  name='PartialConvertResp',
-  full_name='elilypb.PartialConvertResp',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='status', full_name='elilypb.PartialConvertResp.status', index=0,
-      number=1, type=5, cpp_type=1, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='out_str', full_name='elilypb.PartialConvertResp.out_str', index=1,
-      number=2, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=139,
-  serialized_end=192,
-)
-
-DESCRIPTOR.message_types_by_name['ConvertReq'] = _CONVERTREQ
-DESCRIPTOR.message_types_by_name['ConvertResp'] = _CONVERTRESP
-DESCRIPTOR.message_types_by_name['PartialConvertReq'] = _PARTIALCONVERTREQ
-DESCRIPTOR.message_types_by_name['PartialConvertResp'] = _PARTIALCONVERTRESP
-_sym_db.RegisterFileDescriptor(DESCRIPTOR)
-
-ConvertReq = _reflection.GeneratedProtocolMessageType('ConvertReq', (_message.Message,), {
-  'DESCRIPTOR' : _CONVERTREQ,
-  '__module__' : 'elily_pb2'
-  # @@protoc_insertion_point(class_scope:elilypb.ConvertReq)
-  })
-_sym_db.RegisterMessage(ConvertReq)
-
-ConvertResp = _reflection.GeneratedProtocolMessageType('ConvertResp', (_message.Message,), {
-  'DESCRIPTOR' : _CONVERTRESP,
-  '__module__' : 'elily_pb2'
-  # @@protoc_insertion_point(class_scope:elilypb.ConvertResp)
-  })
-_sym_db.RegisterMessage(ConvertResp)
-
-PartialConvertReq = _reflection.GeneratedProtocolMessageType('PartialConvertReq', (_message.Message,), {
-  'DESCRIPTOR' : _PARTIALCONVERTREQ,
-  '__module__' : 'elily_pb2'
-  # @@protoc_insertion_point(class_scope:elilypb.PartialConvertReq)
-  })
-_sym_db.RegisterMessage(PartialConvertReq)
-
-PartialConvertResp = _reflection.GeneratedProtocolMessageType('PartialConvertResp', (_message.Message,), {
-  'DESCRIPTOR' : _PARTIALCONVERTRESP,
-  '__module__' : 'elily_pb2'
-  # @@protoc_insertion_point(class_scope:elilypb.PartialConvertResp)
-  })
-_sym_db.RegisterMessage(PartialConvertResp)
-
-
-
-_ELILYSERVICE = _descriptor.ServiceDescriptor(
-  name='ELilyService',
-  full_name='elilypb.ELilyService',
-  file=DESCRIPTOR,
-  index=0,
-  serialized_options=None,
-  serialized_start=195,
-  serialized_end=342,
-  methods=[
-  _descriptor.MethodDescriptor(
-    name='Convert',
-    full_name='elilypb.ELilyService.Convert',
-    index=0,
-    containing_service=None,
-    input_type=_CONVERTREQ,
-    output_type=_CONVERTRESP,
-    serialized_options=None,
-  ),
-  _descriptor.MethodDescriptor(
-    name='PartialConvert',
-    full_name='elilypb.ELilyService.PartialConvert',
-    index=1,
-    containing_service=None,
-    input_type=_PARTIALCONVERTREQ,
-    output_type=_PARTIALCONVERTRESP,
-    serialized_options=None,
-  ),
-])
-_sym_db.RegisterServiceDescriptor(_ELILYSERVICE)
-
-DESCRIPTOR.services_by_name['ELilyService'] = _ELILYSERVICE
-
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x1b\x63utiefake/proto/elily.proto\x12\x07\x65lilypb\"6\n\x07Segment\x12\x0f\n\x07out_str\x18\x01 \x01(\t\x12\r\n\x05start\x18\x02 \x01(\x05\x12\x0b\n\x03\x65nd\x18\x03 \x01(\x05\"N\n\tCandidate\x12\x0f\n\x07out_str\x18\x01 \x01(\t\x12\x0c\n\x04\x63ost\x18\x02 \x01(\x02\x12\"\n\x08segments\x18\x03 \x03(\x0b\x32\x10.elilypb.Segment\"\x1c\n\nConvertReq\x12\x0e\n\x06in_str\x18\x01 \x01(\t\"R\n\x0b\x43onvertResp\x12\x0e\n\x06status\x18\x01 \x01(\x05\x12\x0f\n\x07out_str\x18\x02 \x01(\t\x12\"\n\x08segments\x18\x03 \x03(\x0b\x32\x10.elilypb.Segment\"3\n\x11PartialConvertReq\x12\x0e\n\x06in_str\x18\x01 \x01(\t\x12\x0e\n\x06n_best\x18\x02 \x01(\x05\"]\n\x12PartialConvertResp\x12\x0e\n\x06status\x18\x01 \x01(\x05\x12\x0f\n\x07out_str\x18\x02 \x03(\t\x12&\n\ncandidates\x18\x03 \x03(\x0b\x32\x12.elilypb.Candidate\"G\n\tEditEvent\x12\x0b\n\x03seq\x18\x01 \x01(\x05\x12\x0e\n\x06in_str\x18\x02 \x01(\t\x12\x0e\n\x06n_best\x18\x03 \x01(\x05\x12\r\n\x05reset\x18\x04 \x01(\x08\"X\n\x11\x43onvertStreamResp\x12\x0e\n\x06status\x18\x01 \x01(\x05\x12\x0b\n\x03seq\x18\x02 \x01(\x05\x12&\n\ncandidates\x18\x03 \x03(\x0b\x32\x12.elilypb.Candidate\"1\n\x0f\x42\x61tchConvertReq\x12\x0e\n\x06in_str\x18\x01 \x03(\t\x12\x0e\n\x06n_best\x18\x02 \x01(\x05\"<\n\x12\x42\x61tchConvertResult\x12&\n\ncandidates\x18\x01 \x03(\x0b\x32\x12.elilypb.Candidate\"P\n\x10\x42\x61tchConvertResp\x12\x0e\n\x06status\x18\x01 \x01(\x05\x12,\n\x07results\x18\x02 \x03(\x0b\x32\x1b.elilypb.BatchConvertResult\"\r\n\x0bGetStatsReq\"3\n\x07\x43ounter\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0b\n\x03rpc\x18\x02 \x01(\t\x12\r\n\x05value\x18\x03 \x01(\x01\"b\n\tHistogram\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0b\n\x03rpc\x18\x02 \x01(\t\x12\x0e\n\x06\x62ounds\x18\x03 \x03(\x01\x12\x0e\n\x06\x63ounts\x18\x04 \x03(\x04\x12\x0b\n\x03sum\x18\x05 \x01(\x01\x12\r\n\x05\x63ount\x18\x06 \x01(\x04\"\xcc\x01\n\x0cGetStatsResp\x12\x0e\n\x06status\x18\x01 \x01(\x05\x12\x31\n\x06gauges\x18\x02 \x03(\x0b\x32!.elilypb.GetStatsResp.GaugesEntry\x12\"\n\x08\x63ounters\x18\x03 \x03(\x0b\x32\x10.elilypb.Counter\x12&\n\nhistograms\x18\x04 \x03(\x0b\x32\x12.elilypb.Histogram\x1a-\n\x0bGaugesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01:\x02\x38\x01\x32\xdc\x02\n\x0c\x45LilyService\x12\x36\n\x07\x43onvert\x12\x13.elilypb.ConvertReq\x1a\x14.elilypb.ConvertResp\"\x00\x12K\n\x0ePartialConvert\x12\x1a.elilypb.PartialConvertReq\x1a\x1b.elilypb.PartialConvertResp\"\x00\x12\x45\n\rConvertStream\x12\x12.elilypb.EditEvent\x1a\x1a.elilypb.ConvertStreamResp\"\x00(\x01\x30\x01\x12\x45\n\x0c\x42\x61tchConvert\x12\x18.elilypb.BatchConvertReq\x1a\x19.elilypb.BatchConvertResp\"\x00\x12\x39\n\x08GetStats\x12\x14.elilypb.GetStatsReq\x1a\x15.elilypb.GetStatsResp\"\x00\x62\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'cutiefake.proto.elily_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_GETSTATSRESP_GAUGESENTRY']._loaded_options = None
+  _globals['_GETSTATSRESP_GAUGESENTRY']._serialized_options = b'8\001'
+  _globals['_SEGMENT']._serialized_start=40
+  _globals['_SEGMENT']._serialized_end=94
+  _globals['_CANDIDATE']._serialized_start=96
+  _globals['_CANDIDATE']._serialized_end=174
+  _globals['_CONVERTREQ']._serialized_start=176
+  _globals['_CONVERTREQ']._serialized_end=204
+  _globals['_CONVERTRESP']._serialized_start=206
+  _globals['_CONVERTRESP']._serialized_end=288
+  _globals['_PARTIALCONVERTREQ']._serialized_start=290
+  _globals['_PARTIALCONVERTREQ']._serialized_end=341
+  _globals['_PARTIALCONVERTRESP']._serialized_start=343
+  _globals['_PARTIALCONVERTRESP']._serialized_end=436
+  _globals['_EDITEVENT']._serialized_start=438
+  _globals['_EDITEVENT']._serialized_end=509
+  _globals['_CONVERTSTREAMRESP']._serialized_start=511
+  _globals['_CONVERTSTREAMRESP']._serialized_end=599
+  _globals['_BATCHCONVERTREQ']._serialized_start=601
+  _globals['_BATCHCONVERTREQ']._serialized_end=650
+  _globals['_BATCHCONVERTRESULT']._serialized_start=652
+  _globals['_BATCHCONVERTRESULT']._serialized_end=712
+  _globals['_BATCHCONVERTRESP']._serialized_start=714
+  _globals['_BATCHCONVERTRESP']._serialized_end=794
+  _globals['_GETSTATSREQ']._serialized_start=796
+  _globals['_GETSTATSREQ']._serialized_end=809
+  _globals['_COUNTER']._serialized_start=811
+  _globals['_COUNTER']._serialized_end=862
+  _globals['_HISTOGRAM']._serialized_start=864
+  _globals['_HISTOGRAM']._serialized_end=962
+  _globals['_GETSTATSRESP']._serialized_start=965
+  _globals['_GETSTATSRESP']._serialized_end=1169
+  _globals['_GETSTATSRESP_GAUGESENTRY']._serialized_start=1124
+  _globals['_GETSTATSRESP_GAUGESENTRY']._serialized_end=1169
+  _globals['_ELILYSERVICE']._serialized_start=1172
+  _globals['_ELILYSERVICE']._serialized_end=1520
 # @@protoc_insertion_point(module_scope)
@@ -1,63 +1,274 @@
 # Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
 import grpc
+import warnings
 
-import elily_pb2 as elily__pb2
+from cutiefake.proto import elily_pb2 as cutiefake_dot_proto_dot_elily__pb2
 
+GRPC_GENERATED_VERSION = '1.84.0'
+GRPC_VERSION = grpc.__version__
+_version_not_supported = False
 
-class ELilyServiceStub(object):
-  # missing associated documentation comment in .proto file
-  pass
+try:
+    from grpc._utilities import first_version_is_lower
+    _version_not_supported = first_version_is_lower(GRPC_VERSION, GRPC_GENERATED_VERSION)
+except ImportError:
+    _version_not_supported = True
 
-  def __init__(self, channel):
-    """Constructor.
+if _version_not_supported:
+    raise RuntimeError(
+        f'The grpc package installed is at version {GRPC_VERSION},'
+        + ' but the generated code in cutiefake/proto/elily_pb2_grpc.py depends on'
+        + f' grpcio>={GRPC_GENERATED_VERSION}.'
+        + f' Please upgrade your grpc module to grpcio>={GRPC_GENERATED_VERSION}'
+        + f' or downgrade your generated code using grpcio-tools<={GRPC_VERSION}.'
+    )
 
-    Args:
-      channel: A grpc.Channel.
-    """
-    self.Convert = channel.unary_unary(
-        '/elilypb.ELilyService/Convert',
-        request_serializer=elily__pb2.ConvertReq.SerializeToString,
-        response_deserializer=elily__pb2.ConvertResp.FromString,
-        )
-    self.PartialConvert = channel.unary_unary(
-        '/elilypb.ELilyService/PartialConvert',
-        request_serializer=elily__pb2.PartialConvertReq.SerializeToString,
-        response_deserializer=elily__pb2.PartialConvertResp.FromString,
-        )
 
+class ELilyServiceStub:
+    """Missing associated documentation comment in .proto file."""
 
-class ELilyServiceServicer(object):
-  # missing associated documentation comment in .proto file
-  pass
+    def __init__(self, channel):
+        """Constructor.
 
-  def Convert(self, request, context):
-    """多分変換
-    """
-    context.set_code(grpc.StatusCode.UNIMPLEMENTED)
-    context.set_details('Method not implemented!')
-    raise NotImplementedError('Method not implemented!')
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.Convert = channel.unary_unary(
+                '/elilypb.ELilyService/Convert',
+                request_serializer=cutiefake_dot_proto_dot_elily__pb2.ConvertReq.SerializeToString,
+                response_deserializer=cutiefake_dot_proto_dot_elily__pb2.ConvertResp.FromString,
+                _registered_method=True)
+        self.PartialConvert = channel.unary_unary(
+                '/elilypb.ELilyService/PartialConvert',
+                request_serializer=cutiefake_dot_proto_dot_elily__pb2.PartialConvertReq.SerializeToString,
+                response_deserializer=cutiefake_dot_proto_dot_elily__pb2.PartialConvertResp.FromString,
+                _registered_method=True)
+        self.ConvertStream = channel.stream_stream(
+                '/elilypb.ELilyService/ConvertStream',
+                request_serializer=cutiefake_dot_proto_dot_elily__pb2.EditEvent.SerializeToString,
+                response_deserializer=cutiefake_dot_proto_dot_elily__pb2.ConvertStreamResp.FromString,
+                _registered_method=True)
+        self.BatchConvert = channel.unary_unary(
+                '/elilypb.ELilyService/BatchConvert',
+                request_serializer=cutiefake_dot_proto_dot_elily__pb2.BatchConvertReq.SerializeToString,
+                response_deserializer=cutiefake_dot_proto_dot_elily__pb2.BatchConvertResp.FromString,
+                _registered_method=True)
+        self.GetStats = channel.unary_unary(
+                '/elilypb.ELilyService/GetStats',
+                request_serializer=cutiefake_dot_proto_dot_elily__pb2.GetStatsReq.SerializeToString,
+                response_deserializer=cutiefake_dot_proto_dot_elily__pb2.GetStatsResp.FromString,
+                _registered_method=True)
 
-  def PartialConvert(self, request, context):
-    """多分部分変換
-    """
-    context.set_code(grpc.StatusCode.UNIMPLEMENTED)
-    context.set_details('Method not implemented!')
-    raise NotImplementedError('Method not implemented!')
+
+class ELilyServiceServicer:
+    """Missing associated documentation comment in .proto file."""
+
+    def Convert(self, request, context):
+        """多分変換
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def PartialConvert(self, request, context):
+        """多分部分変換
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ConvertStream(self, request_iterator, context):
+        """逐次変換 (入力イベントを送信し、変換候補を受信)
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchConvert(self, request, context):
+        """一括変換
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetStats(self, request, context):
+        """稼働状況取得
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
 
 
 def add_ELilyServiceServicer_to_server(servicer, server):
-  rpc_method_handlers = {
-      'Convert': grpc.unary_unary_rpc_method_handler(
-          servicer.Convert,
-          request_deserializer=elily__pb2.ConvertReq.FromString,
-          response_serializer=elily__pb2.ConvertResp.SerializeToString,
-      ),
-      'PartialConvert': grpc.unary_unary_rpc_method_handler(
-          servicer.PartialConvert,
-          request_deserializer=elily__pb2.PartialConvertReq.FromString,
-          response_serializer=elily__pb2.PartialConvertResp.SerializeToString,
-      ),
-  }
-  generic_handler = grpc.method_handlers_generic_handler(
-      'elilypb.ELilyService', rpc_method_handlers)
-  server.add_generic_rpc_handlers((generic_handler,))
+    rpc_method_handlers = {
+            'Convert': grpc.unary_unary_rpc_method_handler(
+                    servicer.Convert,
+                    request_deserializer=cutiefake_dot_proto_dot_elily__pb2.ConvertReq.FromString,
+                    response_serializer=cutiefake_dot_proto_dot_elily__pb2.ConvertResp.SerializeToString,
+            ),
+            'PartialConvert': grpc.unary_unary_rpc_method_handler(
+                    servicer.PartialConvert,
+                    request_deserializer=cutiefake_dot_proto_dot_elily__pb2.PartialConvertReq.FromString,
+                    response_serializer=cutiefake_dot_proto_dot_elily__pb2.PartialConvertResp.SerializeToString,
+            ),
+            'ConvertStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.ConvertStream,
+                    request_deserializer=cutiefake_dot_proto_dot_elily__pb2.EditEvent.FromString,
+                    response_serializer=cutiefake_dot_proto_dot_elily__pb2.ConvertStreamResp.SerializeToString,
+            ),
+            'BatchConvert': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchConvert,
+                    request_deserializer=cutiefake_dot_proto_dot_elily__pb2.BatchConvertReq.FromString,
+                    response_serializer=cutiefake_dot_proto_dot_elily__pb2.BatchConvertResp.SerializeToString,
+            ),
+            'GetStats': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetStats,
+                    request_deserializer=cutiefake_dot_proto_dot_elily__pb2.GetStatsReq.FromString,
+                    response_serializer=cutiefake_dot_proto_dot_elily__pb2.GetStatsResp.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'elilypb.ELilyService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('elilypb.ELilyService', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class ELilyService:
+    """Missing associated documentation comment in .proto file."""
+
+    @staticmethod
+    def Convert(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/elilypb.ELilyService/Convert',
+            cutiefake_dot_proto_dot_elily__pb2.ConvertReq.SerializeToString,
+            cutiefake_dot_proto_dot_elily__pb2.ConvertResp.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def PartialConvert(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/elilypb.ELilyService/PartialConvert',
+            cutiefake_dot_proto_dot_elily__pb2.PartialConvertReq.SerializeToString,
+            cutiefake_dot_proto_dot_elily__pb2.PartialConvertResp.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ConvertStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/elilypb.ELilyService/ConvertStream',
+            cutiefake_dot_proto_dot_elily__pb2.EditEvent.SerializeToString,
+            cutiefake_dot_proto_dot_elily__pb2.ConvertStreamResp.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def BatchConvert(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/elilypb.ELilyService/BatchConvert',
+            cutiefake_dot_proto_dot_elily__pb2.BatchConvertReq.SerializeToString,
+            cutiefake_dot_proto_dot_elily__pb2.BatchConvertResp.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetStats(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/elilypb.ELilyService/GetStats',
+            cutiefake_dot_proto_dot_elily__pb2.GetStatsReq.SerializeToString,
+            cutiefake_dot_proto_dot_elily__pb2.GetStatsResp.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import argparse
+import time
+import numpy as np
+import torch
+from cutiefake.converter import Converter, DEFAULT_BEAM_WIDTH, DEFAULT_N_BEST, DEFAULT_MAX_CANDIDATES
+from cutiefake.bench import bench_converter, DEFAULT_TEXTS
+
+
+def read_texts(in_file):
+    """ 評価用テキスト読み込み
+
+    1行1入力 (CSVの場合は先頭列) とする
+
+    :param in_file: 評価用テキストファイル
+    :return: 入力テキストのリスト
+    """
+    texts = []
+    with open(in_file, "r") as f:
+        for line in f:
+            text = line.rstrip("\n").split(",")[0]
+            if len(text) > 0:
+                texts.append(text)
+    return texts
+
+
+def score_latency(converter, batch_size, repeat):
+    """ スコア算出のみのレイテンシ計測
+
+    :param converter: 変換モジュール
+    :param batch_size: 1回あたりの文節数
+    :param repeat: 計測回数
+    :return: 1回あたりのレイテンシ [ms]
+    """
+    phase_emb = torch.from_numpy(np.array(converter.emb_table[:batch_size], dtype=np.float32))
+    converter.scorer(phase_emb)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        converter.scorer(phase_emb)
+    return (time.perf_counter() - start) * 1000. / repeat
+
+
+def compare_ranking(base, target, texts, n_best):
+    """ 変換順位の比較
+
+    :param base: 基準の変換モジュール (fp32)
+    :param target: 比較対象の変換モジュール (int8)
+    :param texts: 入力テキストのリスト
+    :param n_best: 比較する候補数
+    :return: (1位一致率, 上位 n_best 件の平均一致率, 1位の平均コスト差)
+    """
+    top1 = 0
+    overlap = 0.
+    cost_diff = 0.
+    count = 0
+    for text in texts:
+        base_cands = base.convert(text, n_best)
+        target_cands = target.convert(text, n_best)
+        if len(base_cands) == 0:
+            continue
+        base_ret = [cand["out_str"] for cand in base_cands]
+        target_ret = [cand["out_str"] for cand in target_cands]
+        if base_ret[0] == target_ret[0]:
+            top1 += 1
+        overlap += len(set(base_ret) & set(target_ret)) / len(base_ret)
+        cost_diff += abs(base_cands[0]["cost"] - target_cands[0]["cost"])
+        count += 1
+    count = max(count, 1)
+    return top1 / count, overlap / count, cost_diff / count
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="cutiefake quant-eval")
+    arg_parser.add_argument('-m', '--model_path', help='model path', required=True)
+    arg_parser.add_argument('-i', '--in_file', help='held-out text file (one input per line)', default=None)
+    arg_parser.add_argument('-n', '--n_best', help='n best', type=int, default=DEFAULT_N_BEST)
+    arg_parser.add_argument('-r', '--repeat', help='repeat num', type=int, default=5)
+    arg_parser.add_argument('-b', '--beam_width', help='beam width', type=int, default=DEFAULT_BEAM_WIDTH)
+    arg_parser.add_argument('--threads', help='intra-op thread num (CPU)', type=int, default=None)
+    arg_parser.add_argument('-k', '--max_candidates', help='max candidates per reading', type=int,
+                            default=DEFAULT_MAX_CANDIDATES)
+    arg_parser.add_argument('--score_batch', help='batch size of scoring benchmark', type=int, default=1024)
+    args = arg_parser.parse_args(argv)
+
+    texts = read_texts(args.in_file) if args.in_file is not None else DEFAULT_TEXTS
+    base = Converter(args.model_path, args.beam_width, "cpu", args.threads, args.max_candidates)
+    target = Converter(args.model_path, args.beam_width, "cpu", args.threads, args.max_candidates, quantize=True)
+
+    # 量子化するのはスコア算出のみのため、デコード済み埋め込みテーブルは一致する
+    if not np.array_equal(base.emb_table, target.emb_table):
+        raise ValueError("decoded embedding tables differ between fp32 and int8 converters")
+
+    print("texts: %d / n_best: %d" % (len(texts), args.n_best))
+    for name, converter in [("fp32", base), ("int8", target)]:
+        latency = bench_converter(converter, texts, args.repeat)
+        print("%s latency [ms] mean: %.2f  p50: %.2f  p95: %.2f  score(%d): %.3f" % (
+            name, latency["mean_ms"], latency["p50_ms"], latency["p95_ms"],
+            args.score_batch, score_latency(converter, args.score_batch, args.repeat * 20)))
+
+    top1, overlap, cost_diff = compare_ranking(base, target, texts, args.n_best)
+    print("top1 agreement: %.4f  top%d overlap: %.4f  top1 cost diff: %.6f" % (
+        top1, args.n_best, overlap, cost_diff))
+
+
+if __name__ == "__main__":
+    main()
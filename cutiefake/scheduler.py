@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import time
+import queue
+import threading
+from contextlib import contextmanager
+import torch
+
+DEFAULT_MAX_BATCH_SIZE = 1024
+DEFAULT_MAX_WAIT = 0.002  # [sec]
+
+
+class BatchScheduler:
+    def __init__(self, scorer, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT):
+        """ マイクロバッチスケジューラ
+
+        複数スレッドから同時に依頼されたコスト算出をまとめて、1回の順伝搬で処理する。
+        Scorerと同じ呼び出し形式のため、Converter.scorerと置き換えて使用する
+
+        :param scorer: コスト算出エンジン
+        :param max_batch_size: 1回の順伝搬でまとめる最大行数
+        :param max_wait: 後続の依頼を待つ最大時間 [sec]
+        """
+        self.scorer = scorer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.active_num = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __call__(self, phase_emb):
+        """ コスト算出を依頼して結果を待つ
+
+        :param phase_emb: 文節埋め込み (K x 768)
+        :return: 行ごとの再構成誤差 (K)
+        """
+        req = {"emb": phase_emb, "event": threading.Event(), "costs": None, "error": None}
+        self.queue.put(req)
+        req["event"].wait()
+        if req["error"] is not None:
+            raise req["error"]
+        return req["costs"]
+
+    @contextmanager
+    def active(self):
+        """ 変換処理中であることを登録
+
+        処理中の変換が全て依頼を出した時点で待たずに順伝搬するため、単独の変換では遅延は発生しない
+
+        :return:
+        """
+        with self.lock:
+            self.active_num += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active_num -= 1
+
+    def run(self):
+        """ スケジューラスレッド
+
+        :return:
+        """
+        while True:
+            req = self.queue.get()
+            if req is None:
+                break
+
+            batch = [req]
+            rows = req["emb"].shape[0]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_batch_size and len(batch) < self.active_num:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    req = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if req is None:
+                    stop = True
+                    break
+                batch.append(req)
+                rows += req["emb"].shape[0]
+
+            self.forward(batch)
+            if stop:
+                break
+
+    def forward(self, batch):
+        """ まとめて順伝搬し、依頼元ごとに結果を分配
+
+        :param batch: 依頼のリスト
+        :return:
+        """
+        try:
+            sizes = [req["emb"].shape[0] for req in batch]
+            costs = self.scorer(torch.cat([req["emb"] for req in batch]))
+            for req, req_costs in zip(batch, torch.split(costs, sizes)):
+                req["costs"] = req_costs
+        except Exception as e:
+            for req in batch:
+                req["error"] = e
+        finally:
+            for req in batch:
+                req["event"].set()
+
+    def close(self):
+        """ スケジューラ停止
+
+        :return:
+        """
+        self.queue.put(None)
+        self.thread.join()
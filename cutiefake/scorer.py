@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import threading
+import warnings
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from cutiefake.model import BERT_EMB_DIM
+
+DEVICE_CHOICES = ["auto", "cpu", "cuda"]
+# Scorerの入力バッファの最大行数 (1536次元 float32 で約25MB)
+MAX_BUFFER_ROWS = 4096
+
+
+def get_device(device="auto"):
+    """ 使用デバイス決定
+
+    :param device: "auto" or "cpu" or "cuda"
+    :return:
+    """
+    if device == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+
+def quantize_model(model):
+    """ int8 動的量子化
+
+    Linear層の重みをint8で保持し、入力は実行時にバッチ単位で量子化して計算する (CPUのみ)
+
+    :param model: 量子化するモデル
+    :return: 量子化済みモデル
+    """
+    with warnings.catch_warnings():
+        # torch.ao.quantization の非推奨警告は抑止する
+        warnings.simplefilter("ignore")
+        return torch.ao.quantization.quantize_dynamic(model.to("cpu").eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def score_table(scorer, table, batch_size=4096):
+    """ 全単語の単体コスト算出
+
+    単語1つだけのパスのコストは入力に依存しないため、ビルド時にまとめて算出しておく
+
+    :param scorer: コスト算出エンジン
+    :param table: デコード済み埋め込み (N x 768)
+    :param batch_size: バッチサイズ
+    :return: 単語IDごとのコスト (N)
+    """
+    costs = np.empty(len(table), dtype=np.float32)
+    for i in range(0, len(table), batch_size):
+        phase_emb = torch.from_numpy(np.array(table[i:i + batch_size], dtype=np.float32))
+        costs[i:i + batch_size] = scorer(phase_emb).to("cpu").numpy()
+    return costs
+
+
+class ScoringGraph(nn.Module):
+    def __init__(self, e_model):
+        """ コスト算出グラフ (TorchScript出力用)
+
+        係り先の埋め込みのゼロ埋め、自己符号化器、行ごとの二乗誤差平均までを1つのグラフにまとめる
+
+        :param e_model: ELilyModel
+        """
+        super(ScoringGraph, self).__init__()
+        self.e_model = e_model
+
+    def forward(self, phase_emb):
+        """ 順伝搬
+
+        :param phase_emb: 文節埋め込み (K x 768)
+        :return: 行ごとの再構成誤差 (K)
+        """
+        x_emb = F.pad(phase_emb, (0, BERT_EMB_DIM))
+        y = self.e_model(x_emb)
+        return torch.mean((y - x_emb) ** 2, dim=1)
+
+
+def export_scorer(e_model, file_path):
+    """ コスト算出グラフをTorchScriptとして出力
+
+    CPU向けに重みを定数として埋め込み (freeze)、推論向けの最適化を行う
+
+    :param e_model: ELilyModel
+    :param file_path: 出力ファイルパス
+    :return:
+    """
+    graph = ScoringGraph(e_model.to("cpu")).eval()
+    with warnings.catch_warnings():
+        # torch.jit の非推奨警告は抑止する
+        warnings.simplefilter("ignore")
+        traced = torch.jit.trace(graph, torch.zeros(64, BERT_EMB_DIM))
+        frozen = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        torch.jit.save(frozen, file_path)
+
+
+def load_scorer(file_path):
+    """ TorchScript出力済みのコスト算出エンジン読み込み (CPUのみ)
+
+    :param file_path: ファイルパス
+    :return: コスト算出エンジン
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        graph = torch.jit.load(file_path, map_location="cpu")
+    return ScriptScorer(graph)
+
+
+class ScriptScorer:
+    def __init__(self, graph):
+        """ TorchScriptによるコスト算出エンジン
+
+        Scorerと同じ呼び出し形式で、Pythonのモジュール呼び出しを経由せずに実行する
+
+        :param graph: TorchScript出力済みのコスト算出グラフ
+        """
+        self.graph = graph
+        self.device = "cpu"
+
+    def __call__(self, phase_emb):
+        """ バッチ単位でコスト算出
+
+        :param phase_emb: 文節埋め込み (K x 768)
+        :return: 行ごとの再構成誤差 (K)
+        """
+        with torch.inference_mode():
+            return self.graph(phase_emb)
+
+
+class Scorer:
+    def __init__(self, e_model, device):
+        """ コスト算出エンジン
+
+        :param e_model: ELilyModel
+        :param device: 使用デバイス
+        """
+        self.e_model = e_model
+        self.device = device
+        # 入力バッファはスレッドごとに確保して使い回す (gRPCのスレッドプールから並行して呼ばれるため)
+        self.local = threading.local()
+
+    def __call__(self, phase_emb):
+        """ バッチ単位でコスト算出
+
+        :param phase_emb: 文節埋め込み (K x 768)
+        :return: 行ごとの再構成誤差 (K)
+        """
+        # バッファの上限を超える入力は分割して算出する
+        if phase_emb.shape[0] > MAX_BUFFER_ROWS:
+            return torch.cat([self(phase_emb[i:i + MAX_BUFFER_ROWS])
+                              for i in range(0, phase_emb.shape[0], MAX_BUFFER_ROWS)])
+
+        x_emb = self.buffer(phase_emb.shape[0])
+        with torch.inference_mode():
+            x_emb[:, :BERT_EMB_DIM].copy_(phase_emb)
+            y = self.e_model(x_emb)
+            return torch.mean((y - x_emb) ** 2, dim=1)
+
+    def buffer(self, batch_size):
+        """ 入力バッファ取得
+
+        後半 (係り先の埋め込み) は常にゼロのため、確保時のみゼロ初期化する
+        大きさは MAX_BUFFER_ROWS 行までとし、スレッドごとに保持するメモリを抑える
+
+        :param batch_size: バッチサイズ
+        :return: (batch_size x 1536) のバッファ
+        """
+        buf = getattr(self.local, "buf", None)
+        if buf is None or buf.shape[0] < batch_size:
+            with torch.inference_mode():
+                buf = torch.zeros(max(batch_size, 64), BERT_EMB_DIM * 2, device=self.device)
+            self.local.buf = buf
+        return buf[:batch_size]
@@ -21,23 +21,172 @@
  SOFTWARE.
 """
 import argparse
+import logging
 import time
+import threading
 import grpc
 import cutiefake.proto.elily_pb2_grpc
 import cutiefake.proto.elily_pb2
 from concurrent import futures
-from cutiefake.converter import Converter
+from cutiefake.converter import Converter, DEFAULT_BEAM_WIDTH, DEFAULT_N_BEST, DEFAULT_MAX_CANDIDATES
+from cutiefake.scorer import DEVICE_CHOICES
+from cutiefake.scheduler import BatchScheduler, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT
+from cutiefake.cache import LRUCache, candidates_size, DEFAULT_MAX_ENTRIES, DEFAULT_MAX_BYTES
+from cutiefake.trace import Tracer
+from cutiefake.metrics import Metrics, HISTOGRAMS, serve_metrics
 
 _ONE_DAY_IN_SECONDS = 60 * 60 * 24
+# sync モードでストリームに占有させず単発のRPC用に残すワーカースレッド数
+RESERVED_WORKERS = 2
+
+
+def to_segments(candidate):
+    """ 変換候補の文節をprotobufへ変換
+
+    :param candidate: 変換候補
+    :return:
+    """
+    return [cutiefake.proto.elily_pb2.Segment(out_str=segment["out_str"],
+                                              start=segment["start"],
+                                              end=segment["end"])
+            for segment in candidate["segments"]]
+
+
+def to_candidate(candidate):
+    """ 変換候補をprotobufへ変換
+
+    :param candidate: 変換候補
+    :return:
+    """
+    return cutiefake.proto.elily_pb2.Candidate(out_str=candidate["out_str"],
+                                               cost=candidate["cost"],
+                                               segments=to_segments(candidate))
+
+
+class EditEventSlot:
+    def __init__(self, request_iterator):
+        """ 入力イベント受信 (最新のイベントのみ保持)
+
+        受信は別スレッドで行い、変換中に新しいイベントが届いた場合は古いイベントを破棄する
+
+        :param request_iterator: 入力イベントのイテレータ
+        """
+        self.event = None
+        self.reset = False
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.receive, args=(request_iterator,), daemon=True)
+        self.thread.start()
+
+    def receive(self, request_iterator):
+        """ 受信スレッド
+
+        :param request_iterator:
+        :return:
+        """
+        try:
+            for event in request_iterator:
+                with self.cond:
+                    # 破棄されるイベントのリセット要求は引き継ぐ
+                    self.reset = self.reset or event.reset
+                    self.event = event
+                    self.cond.notify()
+        except grpc.RpcError:
+            pass
+        finally:
+            with self.cond:
+                self.closed = True
+                self.cond.notify()
+
+    def get(self):
+        """ 最新のイベント取得 (届くまで待つ)
+
+        :return: (イベント, リセット要求)、ストリーム終了時は(None, False)
+        """
+        with self.cond:
+            while self.event is None and not self.closed:
+                self.cond.wait()
+            event, reset = self.event, self.reset
+            self.event = None
+            self.reset = False
+            return event, reset
+
+    def has_new(self):
+        """ 未処理のイベントがあるか
+
+        :return:
+        """
+        return self.event is not None
 
 
 class ELilyGateway(cutiefake.proto.elily_pb2_grpc.ELilyServiceServicer):
-    def __init__(self, model):
+    def __init__(self, model, beam_width=DEFAULT_BEAM_WIDTH, device="auto", num_threads=None,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT,
+                 cache_entries=DEFAULT_MAX_ENTRIES, cache_bytes=DEFAULT_MAX_BYTES,
+                 max_candidates=DEFAULT_MAX_CANDIDATES, quantize=False, tracer=None, converter=None,
+                 script=True):
         """ EgoisticLily gRPCサーバークラス
 
         :param model: モデルパス
+        :param beam_width: ビーム幅
+        :param device: 使用デバイス
+        :param num_threads: CPU推論時のスレッド数
+        :param max_batch_size: 同時リクエストをまとめる最大行数
+        :param max_wait: 同時リクエストを待つ最大時間 [sec]
+        :param cache_entries: 変換結果キャッシュの最大エントリ数 (0の場合は無効)
+        :param cache_bytes: 変換結果キャッシュの最大バイト数
+        :param max_candidates: 読みごとの候補数上限
+        :param quantize: int8 動的量子化したモデルで推論する場合はTrue (CPUのみ)
+        :param tracer: フェーズ別計測 (Noneの場合は計測しない)
+        :param converter: 読み込み済みの変換モジュール (指定した場合はモデルを読み込まずに使用する)
+        :param script: バンドルのTorchScriptグラフ (scorer.pt) を使用する場合はTrue
         """
-        self.converter = Converter(model)
+        # 稼働状況の集計
+        self.metrics = Metrics()
+
+        load_start = time.perf_counter()
+        if converter is None:
+            converter = Converter(model, beam_width, device, num_threads, max_candidates, quantize, tracer,
+                                  script)
+        elif tracer is not None:
+            converter.tracer = tracer
+        self.converter = converter
+        self.metrics.model_load_sec = time.perf_counter() - load_start
+        # ラティスの大きさはスレッドごとの集計領域へ記録する (フェーズ別計測の有無によらない)
+        self.converter.lattice_listener = self.metrics.observe_lattice
+
+        # 同時に処理中のリクエストのコスト算出をまとめて順伝搬する
+        self.scheduler = BatchScheduler(self.converter.scorer, max_batch_size, max_wait)
+        self.converter.scorer = self.scheduler
+
+        # 変換結果キャッシュ
+        self.cache = None
+        if cache_entries > 0:
+            self.cache = LRUCache(cache_entries, cache_bytes)
+        self.metrics.scheduler = self.scheduler
+        self.metrics.cache = self.cache
+
+        # 同時に開けるストリーム数の上限 (スレッドプールで処理する場合のみ設定、Noneの場合は無制限)
+        self.stream_slots = None
+
+    def convert(self, in_str, n_best):
+        """ N-best変換 (キャッシュ、スケジューラ経由)
+
+        :param in_str: 変換前テキスト
+        :param n_best: 取得する変換候補数
+        :return: 変換候補のリスト
+        """
+        if self.cache is None:
+            with self.scheduler.active():
+                return self.converter.convert(in_str, n_best)
+
+        key = (self.converter.version, in_str, n_best, self.converter.beam_width, self.converter.max_candidates)
+        candidates = self.cache.get(key)
+        if candidates is None:
+            with self.scheduler.active():
+                candidates = self.converter.convert(in_str, n_best)
+            self.cache.put(key, candidates, candidates_size(in_str, candidates))
+        return candidates
 
     def Convert(self, request, context):
         """ 変換
@@ -46,24 +195,205 @@ class ELilyGateway(cutiefake.proto.elily_pb2_grpc.ELilyServiceServicer):
         :param context:
         :return:
         """
-        ret_str = self.converter(request.in_str)
-        response = cutiefake.proto.elily_pb2.ConvertResp(status=200, out_str=ret_str)
+        with self.metrics.track("Convert"):
+            candidates = self.convert(request.in_str, 1)
+        if len(candidates) == 0:
+            return cutiefake.proto.elily_pb2.ConvertResp(status=200, out_str=request.in_str)
+
+        response = cutiefake.proto.elily_pb2.ConvertResp(status=200,
+                                                         out_str=candidates[0]["out_str"],
+                                                         segments=to_segments(candidates[0]))
+        return response
+
+    def PartialConvert(self, request, context):
+        """ N-best変換
+
+        :param request:
+        :param context:
+        :return:
+        """
+        n_best = request.n_best if request.n_best > 0 else DEFAULT_N_BEST
+        with self.metrics.track("PartialConvert"):
+            candidates = self.convert(request.in_str, n_best)
+        response = cutiefake.proto.elily_pb2.PartialConvertResp(
+            status=200,
+            out_str=[candidate["out_str"] for candidate in candidates],
+            candidates=[to_candidate(candidate) for candidate in candidates])
         return response
 
+    def BatchConvert(self, request, context):
+        """ 一括変換
+
+        :param request:
+        :param context:
+        :return:
+        """
+        n_best = request.n_best if request.n_best > 0 else 1
+        with self.metrics.track("BatchConvert"), self.scheduler.active():
+            results = self.converter.convert_batch(list(request.in_str), n_best)
+        response = cutiefake.proto.elily_pb2.BatchConvertResp(
+            status=200,
+            results=[cutiefake.proto.elily_pb2.BatchConvertResult(
+                candidates=[to_candidate(candidate) for candidate in candidates]) for candidates in results])
+        return response
+
+    def ConvertStream(self, request_iterator, context):
+        """ 逐次変換
+
+        ストリームごとに変換セッションを持ち、前回の入力からの差分のみを処理する。
+        変換中に新しい入力が届いた場合は、その変換を中断して最新の入力を処理する
+
+        :param request_iterator:
+        :param context:
+        :return:
+        """
+        # ストリームは開いている間ワーカースレッドを占有するため、上限を超えた場合は待たせずに拒否する
+        if self.stream_slots is not None and not self.stream_slots.acquire(blocking=False):
+            self.metrics.inc("cutiefake_rpc_rejected_total", "ConvertStream")
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                          "too many open streams (use --mode aio for many concurrent sessions)")
+
+        try:
+            slot = EditEventSlot(request_iterator)
+            session = self.converter.session()
+            while True:
+                event, reset = slot.get()
+                if event is None:
+                    break
+
+                response = self.convert_event(session, event, reset, slot.has_new)
+                if response is not None:
+                    yield response
+        finally:
+            if self.stream_slots is not None:
+                self.stream_slots.release()
+
+    def convert_event(self, session, event, reset, cancel):
+        """ 入力イベントの変換
 
-def main():
+        :param session: 変換セッション
+        :param event: 入力イベント
+        :param reset: リセット要求
+        :param cancel: 中断判定関数
+        :return: レスポンス、中断した場合はNone
+        """
+        if reset:
+            session.reset()
+
+        n_best = event.n_best if event.n_best > 0 else DEFAULT_N_BEST
+        with self.metrics.track("ConvertStream"), self.scheduler.active():
+            candidates = session(event.in_str, n_best, cancel)
+        if candidates is None:
+            return None
+
+        return cutiefake.proto.elily_pb2.ConvertStreamResp(
+            status=200,
+            seq=event.seq,
+            candidates=[to_candidate(candidate) for candidate in candidates])
+
+    def GetStats(self, request, context):
+        """ 稼働状況取得
+
+        :param request:
+        :param context:
+        :return:
+        """
+        stats = self.metrics.collect()
+        counters = [cutiefake.proto.elily_pb2.Counter(name=name, rpc=label, value=value)
+                    for (name, label), value in sorted(stats["counters"].items())]
+        histograms = [cutiefake.proto.elily_pb2.Histogram(name=name, rpc=label, bounds=HISTOGRAMS[name],
+                                                          counts=counts, sum=total, count=sum(counts))
+                      for (name, label), (counts, total) in sorted(stats["histograms"].items())]
+        return cutiefake.proto.elily_pb2.GetStatsResp(status=200, gauges=stats["gauges"],
+                                                      counters=counters, histograms=histograms)
+
+
+def main(argv=None):
     """ EgoisticLily gRPCサーバーモジュール
 
     :return:
     """
-    arg_parser = argparse.ArgumentParser()
+    arg_parser = argparse.ArgumentParser(prog="cutiefake serve")
     arg_parser.add_argument('-m', '--model', help='model path', required=True)
     arg_parser.add_argument('-p', '--port', help='server port number', default='50055')
-    args = arg_parser.parse_args()
+    arg_parser.add_argument('-b', '--beam_width', help='beam width', type=int, default=DEFAULT_BEAM_WIDTH)
+    arg_parser.add_argument('-d', '--device', help='device', choices=DEVICE_CHOICES, default='auto')
+    arg_parser.add_argument('--threads', help='intra-op thread num (CPU)', type=int, default=None)
+    arg_parser.add_argument('-k', '--max_candidates', help='max candidates per reading', type=int,
+                            default=DEFAULT_MAX_CANDIDATES)
+    arg_parser.add_argument('-q', '--quantize', help='int8 dynamic quantization (CPU)', action='store_true')
+    arg_parser.add_argument('--no_script',
+                            help='use the mmap-shared eager model instead of scorer.pt (implied by --processes > 1)',
+                            action='store_true')
+    arg_parser.add_argument('--trace', help='enable per-phase timing', action='store_true')
+    arg_parser.add_argument('--metrics_port', help='prometheus metrics port (0: disabled)', type=int, default=0)
+    arg_parser.add_argument('--metrics_host', help='prometheus metrics bind address', default='127.0.0.1')
+    arg_parser.add_argument('--trace_sample', help='ratio of requests to log per-phase timing (enables --trace)',
+                            type=float, default=0.)
+    arg_parser.add_argument('--max_batch_size', help='max rows per batched forward', type=int,
+                            default=DEFAULT_MAX_BATCH_SIZE)
+    arg_parser.add_argument('--max_wait_ms', help='max wait for batching [ms]', type=float,
+                            default=DEFAULT_MAX_WAIT * 1000.)
+    arg_parser.add_argument('--cache_entries', help='max entries of result cache (0: disable)', type=int,
+                            default=DEFAULT_MAX_ENTRIES)
+    arg_parser.add_argument('--cache_mb', help='max size of result cache [MB]', type=int,
+                            default=DEFAULT_MAX_BYTES // (1024 * 1024))
+    arg_parser.add_argument('--mode', help='server mode (sync: thread pool / aio: asyncio)',
+                            choices=['sync', 'aio'], default='sync')
+    arg_parser.add_argument('--max_workers', help='conversion worker thread num', type=int, default=10)
+    arg_parser.add_argument('--max_streams',
+                            help='max open ConvertStream per process in sync mode '
+                                 '(default: max_workers - %d, each stream holds a worker thread; '
+                                 'use --mode aio for many IME sessions)' % RESERVED_WORKERS,
+                            type=int, default=None)
+    arg_parser.add_argument('--max_concurrent_rpcs', help='reject RPCs beyond this number in sync mode',
+                            type=int, default=None)
+    arg_parser.add_argument('--grace', help='shutdown grace period [sec]', type=float, default=5.)
+    arg_parser.add_argument('--processes', help='server process num (pre-fork, shares the model via mmap)',
+                            type=int, default=1)
+    args = arg_parser.parse_args(argv)
+
+    if args.processes > 1:
+        from cutiefake.prefork import serve_prefork
+        serve_prefork(args)
+        return
+
+    serve(args)
+
+
+def serve(args, options=None):
+    """ サーバー起動 (1プロセス分)
+
+    :param args: コマンドライン引数
+    :param options: gRPCサーバーオプション
+    :return:
+    """
+    tracer = None
+    if args.trace or args.trace_sample > 0.:
+        tracer = Tracer(args.trace_sample)
+        if args.trace_sample > 0.:
+            logging.basicConfig(level=logging.INFO)
+    gateway = ELilyGateway(args.model, args.beam_width, args.device, args.threads,
+                           args.max_batch_size, args.max_wait_ms / 1000.,
+                           args.cache_entries, args.cache_mb * 1024 * 1024, args.max_candidates,
+                           args.quantize, tracer, script=not args.no_script)
+    if args.metrics_port > 0:
+        serve_metrics(gateway.metrics, args.metrics_port, args.metrics_host)
+    if args.mode == "aio":
+        from cutiefake.aio_server import serve
+        serve(gateway, args.port, args.max_workers, args.grace, options)
+        return
+
+    # ストリームが全スレッドを占有して単発のRPCが処理されなくならないよう、スレッドを残して上限を設ける
+    max_streams = args.max_streams
+    if max_streams is None:
+        max_streams = max(1, args.max_workers - RESERVED_WORKERS)
+    gateway.stream_slots = threading.BoundedSemaphore(max_streams)
 
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    cutiefake.proto.elily_pb2_grpc.add_ELilyServiceServicer_to_server(
-        ELilyGateway(args.model), server)
+    executor = futures.ThreadPoolExecutor(max_workers=args.max_workers)
+    gateway.metrics.executor = executor
+    server = grpc.server(executor, options=options, maximum_concurrent_rpcs=args.max_concurrent_rpcs)
+    cutiefake.proto.elily_pb2_grpc.add_ELilyServiceServicer_to_server(gateway, server)
 
     # portの設定
     port_str = '[::]:' + args.port
@@ -75,7 +405,7 @@ def main():
             time.sleep(_ONE_DAY_IN_SECONDS)
 
     except KeyboardInterrupt:
-        server.stop(0)
+        server.stop(args.grace).wait()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+ Copyright (c) 2020 Masahiko Hashimoto <hashimom@geeko.jp>
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+# 計測するフェーズ (ラティス構築、候補パス展開、コスト算出、ビーム更新、N-best取得)
+PHASES = ["lattice", "expand", "score", "update", "backtrace"]
+# リクエストごとの件数 (テキスト数、文字数、ノード数、候補パス数、展開した終了位置数)
+COUNTS = ["texts", "chars", "nodes", "candidates", "positions"]
+DEFAULT_HISTORY = 1000
+
+
+class Tracer:
+    def __init__(self, sample_rate=0., history=DEFAULT_HISTORY, logger=None):
+        """ 変換処理のフェーズ別計測
+
+        Converter.tracer に設定した場合のみ計測する (未設定時は判定1回のみ)
+
+        :param sample_rate: ログ出力するリクエストの割合 (0の場合は出力しない)
+        :param history: 保持する直近の計測結果数
+        :param logger: ログ出力先 (Noneの場合は "cutiefake.trace")
+        """
+        self.sample_rate = sample_rate
+        self.logger = logger if logger is not None else logging.getLogger("cutiefake.trace")
+        self.lock = threading.Lock()
+        self.history = deque(maxlen=history)
+        self.requests = 0
+        self.totals = {key: 0. for key in [phase + "_ms" for phase in PHASES] + ["total_ms"] + COUNTS}
+
+    def start(self):
+        """ 計測開始
+
+        :return: 計測結果 (リクエストごと)
+        """
+        now = time.perf_counter()
+        trace = {"time": time.time(), "start": now, "lap": now}
+        for phase in PHASES:
+            trace[phase + "_ms"] = 0.
+        for count in COUNTS:
+            trace[count] = 0
+        return trace
+
+    def lap(self, trace, phase):
+        """ 前回の区切りからの経過時間をフェーズへ加算
+
+        :param trace: 計測結果
+        :param phase: フェーズ名
+        :return:
+        """
+        now = time.perf_counter()
+        trace[phase + "_ms"] += (now - trace["lap"]) * 1000.
+        trace["lap"] = now
+
+    def finish(self, trace):
+        """ 計測終了
+
+        :param trace: 計測結果
+        :return:
+        """
+        trace["total_ms"] = (time.perf_counter() - trace.pop("start")) * 1000.
+        del trace["lap"]
+        with self.lock:
+            self.requests += 1
+            for key in self.totals:
+                self.totals[key] += trace[key]
+            self.history.append(trace)
+
+        if self.sample_rate > 0. and random.random() < self.sample_rate:
+            self.logger.info("trace %s", json.dumps(trace))
+
+    def recent(self, n=None):
+        """ 直近の計測結果取得
+
+        :param n: 取得件数 (Noneの場合は保持している全件)
+        :return: 計測結果のリスト (古い順)
+        """
+        with self.lock:
+            traces = list(self.history)
+        return traces if n is None else traces[-n:]
+
+    def stats(self):
+        """ 計測結果の集計
+
+        :return: リクエスト数と、フェーズ・件数ごとの平均
+        """
+        with self.lock:
+            requests = self.requests
+            totals = dict(self.totals)
+        return {"requests": requests,
+                "mean": {key: value / max(requests, 1) for key, value in totals.items()}}
@@ -21,9 +21,7 @@
  SOFTWARE.
 """
 import argparse
-import glob
 import os
-import pickle
 import numpy as np
 import torch
 import torch.nn as nn
@@ -31,55 +29,96 @@ import torch.optim as optim
 import csv
 from tqdm import tqdm
 from cutiefake.model import ELilyBert, BertEncoder, BertDecoder, ELilyModel
+from cutiefake.emb_table import decode_codes, save_table, load_table, save_costs
+from cutiefake.emb_table import DECODED_EMB_FILE, STANDALONE_COST_FILE
+from cutiefake.scorer import Scorer, score_table
+from cutiefake.emb_store import EmbStore, LinkStore, STORE_FILE, is_store, convert_pickle, build_link_store
 from torch.utils.data import Dataset
 
+LEGACY_STORE_SUFFIX = ".store"
+
 
 class BertDataSets(Dataset):
     def __init__(self, word_emb_file, transform=None):
+        """ 単語埋め込みデータセット
+
+        埋め込みストアをメモリマップで参照する
+        旧形式 (word_emb.pkl) の場合は初回のみ word_emb.pkl.store へ変換してから参照する
+
+        :param word_emb_file: 埋め込みストアのディレクトリ、または旧形式のファイル
+        :param transform:
+        """
         self.word_emb_file = word_emb_file
         self.transform = transform
-        self.word_phase = []
-        self.word_read = []
-        self.words_emb = []
-
-        with open(word_emb_file, 'rb') as f:
-            while True:
-                try:
-                    pkl_data = pickle.load(f)
-                    self.word_phase.append(pkl_data[0])
-                    self.word_read.append(pkl_data[1])
-                    self.words_emb.append(pkl_data[2])
-                except EOFError:
-                    # ファイル末尾のため終了
-                    print("Word pickle file read end")
-                    break
+
+        store_path = word_emb_file
+        if not is_store(word_emb_file):
+            store_path = word_emb_file + LEGACY_STORE_SUFFIX
+            store_file = os.path.join(store_path, STORE_FILE)
+            if not os.path.isfile(store_file) or os.path.getmtime(store_file) < os.path.getmtime(word_emb_file):
+                convert_pickle(word_emb_file, store_path)
+                print("Word pickle file convert end")
+        self.store = EmbStore(store_path)
 
     def __len__(self):
-        return len(self.words_emb)
+        return len(self.store)
 
     def __getitem__(self, idx):
-        return self.word_phase[idx], self.word_read[idx], self.words_emb[idx]
+        """ 取得
+
+        :param idx: 行番号、または行番号のリスト (バッチ単位)
+        :return: (表記, 読み, 埋め込み)
+        """
+        if isinstance(idx, (list, np.ndarray)):
+            return self.store.batch(idx)
+        return self.store[idx]
 
 
 class ELilyDataSets(Dataset):
     def __init__(self, link_files_dir, transform=None):
-        self.transform = transform
-        self.words_emb = []
-        self.link_emb = []
+        """ 係り受け学習データセット
+
+        *.pkl を文節と係り先の埋め込みを連結済みのキャッシュ (link_cache) へ変換し、メモリマップで参照する
 
-        file_list = glob.glob(link_files_dir + "/*.pkl")
-        for file in file_list:
-            with open(file, 'rb') as f:
-                pkl_data = pickle.load(f)
-                for data in pkl_data:
-                    self.words_emb.append(data[0])
-                    self.link_emb.append(data[1].astype(np.float32))
+        :param link_files_dir: 係り受け学習データのディレクトリ
+        :param transform:
+        """
+        self.transform = transform
+        self.store = LinkStore(build_link_store(link_files_dir))
 
     def __len__(self):
-        return len(self.words_emb)
+        return len(self.store)
 
     def __getitem__(self, idx):
-        return self.words_emb[idx], self.link_emb[idx]
+        """ 取得
+
+        :param idx: 行番号、または行番号のリスト (バッチ単位)
+        :return: 連結済みの埋め込み
+        """
+        if isinstance(idx, (list, np.ndarray)):
+            return self.store.batch(idx)
+        return self.store[idx]
+
+
+def batch_loader(dataset, batch_size, shuffle, num_workers=0):
+    """ バッチ単位で取得する DataLoader を生成
+
+    行ごとに取得して結合せず、データセットから1バッチ分をまとめて取り出す
+
+    :param dataset: データセット
+    :param batch_size: バッチサイズ
+    :param shuffle: シャッフル有無
+    :param num_workers: ワーカー数
+    :return:
+    """
+    if shuffle:
+        sampler = torch.utils.data.RandomSampler(dataset)
+    else:
+        sampler = torch.utils.data.SequentialSampler(dataset)
+    return torch.utils.data.DataLoader(dataset,
+                                       batch_size=None,
+                                       sampler=torch.utils.data.BatchSampler(sampler, batch_size, drop_last=False),
+                                       num_workers=num_workers)
 
 
 class BertTrainer:
@@ -114,10 +153,7 @@ class BertTrainer:
         :param batch_size:
         :return:
         """
-        train_loader = torch.utils.data.DataLoader(self.dataset,
-                                                   batch_size=batch_size,
-                                                   shuffle=True,
-                                                   num_workers=2)
+        train_loader = batch_loader(self.dataset, batch_size, shuffle=True, num_workers=2)
 
         # 学習開始
         criterion = nn.MSELoss()
@@ -142,19 +178,23 @@ class BertTrainer:
         torch.save(self.decoder.state_dict(), self.out_dir + "/decoder.mdl")
 
         print("words.csv output start")
-        with open(self.word_emb_file, 'rb') as in_f:
-            with open('words.csv', 'w') as out_f:
-                writer = csv.writer(out_f)
-                while True:
-                    try:
-                        pkl_data = pickle.load(in_f)
-                        x_in = torch.from_numpy(pkl_data[2]).to(self.use_device)
-                        y = self.encoder(x_in)
-                        writer.writerow([pkl_data[0], pkl_data[1], y.to("cpu").item()])
-                    except EOFError:
-                        # ファイル末尾のため終了
-                        print("Words csv output end")
-                        break
+        codes = []
+        self.encoder.eval()
+        word_loader = batch_loader(self.dataset, 4096, shuffle=False)
+        with open('words.csv', 'w') as out_f:
+            writer = csv.writer(out_f)
+            with torch.no_grad():
+                for word_phase, word_read, word_emb in word_loader:
+                    y = self.encoder(word_emb.to(self.use_device)).to("cpu").numpy().reshape(-1)
+                    for phase, read, code in zip(word_phase, word_read, y.tolist()):
+                        writer.writerow([phase, read, code])
+                        codes.append(code)
+        print("Words csv output end")
+
+        # 変換時にデコーダを実行しないよう、words.csv と同じ順でデコード済み埋め込みを出力
+        self.decoder.eval()
+        save_table(self.out_dir, decode_codes(self.decoder, codes, device=self.use_device))
+        print("%s output end" % DECODED_EMB_FILE)
 
 
 class ELilyTrainer:
@@ -166,6 +206,8 @@ class ELilyTrainer:
         """
         # データセット作成
         self.dataset = ELilyDataSets(link_files_dir)
+        if len(self.dataset) == 0:
+            raise ValueError("no link training data in %s (*.pkl)" % link_files_dir)
 
         # モデル配置ディレクトリ生成
         if not os.path.isdir(output_dir):
@@ -186,10 +228,7 @@ class ELilyTrainer:
         :param batch_size:
         :return:
         """
-        train_loader = torch.utils.data.DataLoader(self.dataset,
-                                                   batch_size=batch_size,
-                                                   shuffle=True,
-                                                   num_workers=2)
+        train_loader = batch_loader(self.dataset, batch_size, shuffle=True, num_workers=2)
 
         # 学習開始
         criterion = nn.MSELoss()
@@ -197,8 +236,7 @@ class ELilyTrainer:
         self.elily_model.train()
         for i in range(epoch_num):
             batch_loss = 0.
-            for (phase, link) in train_loader:
-                x_in = torch.cat([phase, link], dim=1)
+            for x_in in train_loader:
                 x_in = x_in.to(self.use_device)
                 y = self.elily_model(x_in)
                 loss = criterion(y, x_in)
@@ -213,10 +251,17 @@ class ELilyTrainer:
 
         torch.save(self.elily_model.state_dict(), self.out_dir + "/dnn.mdl")
 
+        # 単語単体のコストは入力に依存しないため、全単語分を算出して出力
+        table = load_table(self.out_dir)
+        if table is not None:
+            self.elily_model.eval()
+            save_costs(self.out_dir, score_table(Scorer(self.elily_model, self.use_device), table))
+            print("%s output end" % STANDALONE_COST_FILE)
+
 
 def main():
     arg_parser = argparse.ArgumentParser()
-    arg_parser.add_argument('-w', '--words_emb_file', help='word_emb file', required=True)
+    arg_parser.add_argument('-w', '--words_emb_file', help='word_emb store (or legacy word_emb.pkl)', required=True)
     arg_parser.add_argument('-l', '--linked_file', help='link file', required=True)
     arg_parser.add_argument('-o', '--output_path', help='output model path', required=True)
     args = arg_parser.parse_args()
@@ -99,18 +99,30 @@ class Words:
         self.type1_one_hot = np.eye(len(self.word_type_list[0]), dtype="float32")
         self.type2_one_hot = np.eye(len(self.word_type_list[1]), dtype="float32")
         self.vec_id_bit_num = 16
+        self.feature_dim = self.vec_id_bit_num + len(self.word_type_list[0]) + len(self.word_type_list[1])
 
     def __call__(self, vec_id, type1, type2):
-        id_ary = []
-        tmp = vec_id
-        for i in range(self.vec_id_bit_num):
-            if tmp & 1:
-                id_ary.append(1.)
-            else:
-                id_ary.append(0.)
-            tmp = tmp >> 1
+        return self.batch([vec_id], [type1], [type2])[0]
 
-        ret_ary = np.array(id_ary, dtype="float32")
-        ret_ary = np.hstack((ret_ary, self.type1_one_hot[int(type1)]))
-        ret_ary = np.hstack((ret_ary, self.type2_one_hot[int(type2)]))
+    def batch(self, vec_ids, type1s, type2s):
+        """ 単語ベクトル一括生成
+
+        vec_id の下位ビットから順にビット展開し、品詞1・品詞2のワンホットを連結する
+
+        :param vec_ids: vec_id の配列 (N)
+        :param type1s: 品詞1 の配列 (N)
+        :param type2s: 品詞2 の配列 (N)
+        :return: 単語ベクトル (N x 80)
+        """
+        vec_ids = np.asarray(vec_ids, dtype=np.int64)
+        type1s = np.asarray(type1s, dtype=np.int64)
+        type2s = np.asarray(type2s, dtype=np.int64)
+        rows = np.arange(len(vec_ids))
+        type1_offset = self.vec_id_bit_num
+        type2_offset = type1_offset + len(self.word_type_list[0])
+
+        ret_ary = np.zeros((len(vec_ids), self.feature_dim), dtype="float32")
+        ret_ary[:, :self.vec_id_bit_num] = (vec_ids[:, np.newaxis] >> np.arange(self.vec_id_bit_num)) & 1
+        ret_ary[rows, type1_offset + type1s] = 1.
+        ret_ary[rows, type2_offset + type2s] = 1.
         return ret_ary
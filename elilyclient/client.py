@@ -21,6 +21,7 @@
  SOFTWARE.
 """
 import argparse
+import queue
 import grpc
 import cutiefake.proto.elily_pb2_grpc
 import cutiefake.proto.elily_pb2
@@ -37,6 +38,56 @@ def to_server(stub, kana):
     print("漢字: " + response.out_str)
 
 
+def edit_events(event_q):
+    """ 入力イベントのストリーム
+
+    :param event_q: 送信キュー
+    :return:
+    """
+    while True:
+        event = event_q.get()
+        if event is None:
+            return
+        yield event
+
+
+def to_server_stream(stub):
+    """ EgoisticLily逐次変換 (1本のストリームで送受信)
+
+    :param stub:
+    :return:
+    """
+    event_q = queue.Queue()
+    responses = stub.ConvertStream(edit_events(event_q))
+    seq = 0
+    try:
+        while True:
+            kana = input("かな > ")
+            seq += 1
+            event_q.put(cutiefake.proto.elily_pb2.EditEvent(seq=seq, in_str=kana))
+            response = next(responses)
+            for candidate in response.candidates:
+                print("漢字: " + candidate.out_str)
+    finally:
+        event_q.put(None)
+
+
+def print_stats(stub):
+    """ サーバーの稼働状況表示
+
+    :param stub:
+    :return:
+    """
+    response = stub.GetStats(cutiefake.proto.elily_pb2.GetStatsReq())
+    for name, value in sorted(response.gauges.items()):
+        print("%s: %g" % (name, value))
+    for counter in response.counters:
+        print("%s{%s}: %g" % (counter.name, counter.rpc, counter.value))
+    for histogram in response.histograms:
+        mean = histogram.sum / histogram.count if histogram.count > 0 else 0.
+        print("%s{%s}: count %d / mean %g" % (histogram.name, histogram.rpc, histogram.count, mean))
+
+
 def main():
     """ EgoisticLily クライアントモジュール
 
@@ -44,12 +95,20 @@ def main():
     """
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('-p', '--port', help='server port number', default='50055')
+    arg_parser.add_argument('-s', '--stream', help='use ConvertStream', action='store_true')
+    arg_parser.add_argument('--stats', help='print server stats and exit', action='store_true')
     args = arg_parser.parse_args()
 
     port_str = '[::]:' + args.port
     with grpc.insecure_channel(port_str) as channel:
         stub = cutiefake.proto.elily_pb2_grpc.ELilyServiceStub(channel)
+        if args.stats:
+            print_stats(stub)
+            return
         print('--EgoisticLily Client--')
+        if args.stream:
+            to_server_stream(stub)
+            return
         while True:
             kana = input("かな > ")
             to_server(stub, kana)
@@ -5,12 +5,14 @@ setup(
     version='0.0.1',
     packages=['cutiefake', 'cutiefake.modelmaker', 'cutiefake.proto'],
     install_requires=[
-        "torch",
+        "torch>=2.1",
         "numpy",
         "tqdm",
-        "marisa-trie",
+        "marisa-trie>=0.8.0",
         "transformers",
-        "grpcio-tools"
+        "grpcio>=1.84.0",
+        "grpcio-tools",
+        "protobuf>=7.35.1"
     ],
     url='https://github.com/hashimom/CutieFake',
     license='MIT',
@@ -18,7 +20,7 @@ setup(
     author_email='hashimom@geeko.jp',
     entry_points={
         "console_scripts": [
-            "cutiefake = cutiefake.server:main",
+            "cutiefake = cutiefake.cli:main",
         ],
     },
     description=''
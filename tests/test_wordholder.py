@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from cutiefake.modelmaker.wordholder import WordHolder
+
+
+def test_readd_built_surface(tmp_path):
+    """ 反映済みの表記を再登録した場合、行を追加せずに上書きする """
+    holder = WordHolder()
+    holder.add("猫", "ねこ", 1, 1, 1)
+    holder.add("犬", "いぬ", 2, 1, 1)
+    holder.build()
+
+    holder.add("猫", "にゃん", 3, 2, 2)
+    assert len(holder) == 2
+    assert holder.words("ねこ") == []
+    assert holder.words("にゃん") == ["猫"]
+    holder.build()
+    assert len(holder) == 2
+    assert holder.words("にゃん") == ["猫"]
+
+    holder.save(str(tmp_path))
+    with open(str(tmp_path / "words.csv"), encoding="utf-8") as f:
+        assert f.read().split() == ["猫,にゃん,3,2,2", "犬,いぬ,2,1,1"]
+    for loaded in [WordHolder(str(tmp_path)), WordHolder(str(tmp_path / "words.csv"))]:
+        assert len(loaded) == 2
+        assert loaded.words("ねこ") == []
+        assert loaded.words("にゃん") == ["猫"]
+        assert np.array_equal(loaded.vectors(), holder.vectors())